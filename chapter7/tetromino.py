@@ -3,22 +3,20 @@
 # http://inventwithpython.com/pygame
 # Creative Commons BY-NC-SA 3.0 US
 
-import random, time, pygame, sys
+import random, pygame, sys
 from pygame.locals import *
+# The board, the pieces and the rules of the game don't need pygame, so
+# they are in tetromino_engine.py where they can be used without a window.
+from tetromino_engine import *
 
-FPS = 25
 WINDOWWIDTH = 640
 WINDOWHEIGHT = 480
 BOXSIZE = 20
-BOARDWIDTH = 10
-BOARDHEIGHT = 20
-BLANK = '.'
-
-MOVESIDEWAYSFREQ = 0.15
-MOVEDOWNFREQ = 0.1
 
 XMARGIN = int((WINDOWWIDTH - BOARDWIDTH * BOXSIZE) / 2)
 TOPMARGIN = WINDOWHEIGHT - (BOARDHEIGHT * BOXSIZE) - 5
+# the area of the screen covered by the board and its border
+BOARDRECT = pygame.Rect(XMARGIN - 3, TOPMARGIN - 7, (BOARDWIDTH * BOXSIZE) + 8, (BOARDHEIGHT * BOXSIZE) + 8)
 
 # RGB
 WHITE       = (255, 255, 255)
@@ -40,116 +38,27 @@ TEXTSHADOWCOLOR = GRAY
 COLORS = ( BLUE, GREEN, RED, YELLOW)
 LIGHTCOLORS = (LIGHTBLUE, LIGHTGREEN, LIGHTRED, LIGHTYELLOW)
 assert len(COLORS) == len(LIGHTCOLORS) # each color must have light color
+assert len(COLORS) == NUM_COLORS
+
+# the engine action for each key
+KEYACTIONS = {K_LEFT: LEFT, K_a: LEFT,
+              K_RIGHT: RIGHT, K_d: RIGHT,
+              K_UP: ROTATE, K_w: ROTATE,
+              K_q: ROTATE_BACK, # rotate the other direction
+              K_DOWN: DOWN, K_s: DOWN,
+              K_SPACE: DROP}
 
-TEMPLATEWIDTH = 5
-TEMPLATEHEIGHT = 5
-
-S_SHAPE_TEMPLATE = [['.....',
-                     '.....',
-                     '..OO.',
-                     '.OO..',
-                     '.....'],
-                    ['.....',
-                     '..O..',
-                     '..OO.',
-                     '...O.',
-                     '.....']]
-Z_SHAPE_TEMPLATE = [['.....',
-                     '.....',
-                     '.OO..',
-                     '..OO.',
-                     '.....'],
-                    ['.....',
-                     '..O..',
-                     '.OO..',
-                     '.O...',
-                     '.....']]
-I_SHAPE_TEMPLATE = [['..O..',
-                     '..O..',
-                     '..O..',
-                     '..O..',
-                     '.....'],
-                    ['.....',
-                     '.....',
-                     'OOOO.',
-                     '.....',
-                     '.....']]
-O_SHAPE_TEMPLATE = [['.....',
-                     '.....',
-                     '.OO..',
-                     '.OO..',
-                     '.....']]
-J_SHAPE_TEMPLATE = [['.....',
-                     '.O...',
-                     '.OOO.',
-                     '.....',
-                     '.....'],
-                    ['.....',
-                     '..OO.',
-                     '..O..',
-                     '..O..',
-                     '.....'],
-                    ['.....',
-                     '.....',
-                     '.OOO.',
-                     '...O.',
-                     '.....'],
-                    ['.....',
-                     '..O..',
-                     '..O..',
-                     '.OO..',
-                     '.....']]
-L_SHAPE_TEMPLATE = [['.....',
-                     '...O.',
-                     '.OOO.',
-                     '.....',
-                     '.....'],
-                    ['.....',
-                     '..O..',
-                     '..O..',
-                     '..OO.',
-                     '.....'],
-                    ['.....',
-                     '.....',
-                     '.OOO.',
-                     '.O...',
-                     '.....'],
-                    ['.....',
-                     '.OO..',
-                     '..O..',
-                     '..O..',
-                     '.....']]
-T_SHAPE_TEMPLATE = [['.....',
-                     '..O..',
-                     '.OOO.',
-                     '.....',
-                     '.....'],
-                    ['.....',
-                     '..O..',
-                     '..OO.',
-                     '..O..',
-                     '.....'],
-                    ['.....',
-                     '.....',
-                     '.OOO.',
-                     '..O..',
-                     '.....'],
-                    ['.....',
-                     '..O..',
-                     '.OO..',
-                     '..O..',
-                     '.....']]
-
-SHAPES = {'S': S_SHAPE_TEMPLATE,
-          'Z': Z_SHAPE_TEMPLATE,
-          'J': J_SHAPE_TEMPLATE,
-          'L': L_SHAPE_TEMPLATE,
-          'I': I_SHAPE_TEMPLATE,
-          'O': O_SHAPE_TEMPLATE,
-          'T': T_SHAPE_TEMPLATE}
+RECORDFILE = None # the file games are recorded to, if any
+RECORDING = None # the recording of the game being played (see tetromino_engine.py)
 
 def main():
-    global FPSCLOCK, DISPLAYSURF, BASICFONT, BIGFONT
+    # Usage: python tetromino.py [record file]
+    # If a record file is given, every game is recorded to it so that it
+    # can be played back with tetromino_replay.py.
+    global FPSCLOCK, DISPLAYSURF, BASICFONT, BIGFONT, RECORDFILE
+
+    if len(sys.argv) > 1:
+        RECORDFILE = open(sys.argv[1], 'wb')
 
     pygame.init()
 
@@ -172,31 +81,22 @@ def main():
 
 def run_game():
     # setup variables for the start of the game
-    board = get_blank_board()
-    last_move_down_time = time.time()
-    last_move_sideways_time = time.time()
-    last_fall_time = time.time()
-    moving_down = False # note: there is no moving_up variable
-    moving_left = False
-    moving_right = False
-    score = 0
-    level, fall_freq = calculate_level_and_fall_freq(score)
-
-    falling_piece = get_new_piece()
-    next_piece = get_new_piece()
+    global RECORDING
+    seed = random.randrange(2 ** 32)
+    engine = TetrominoEngine()
+    engine.reset(seed)
+    if RECORDFILE != None:
+        RECORDING = {'seed': seed, 'inputs': [], 'ticks': 0, 'score': 0}
+    # The boxes on the board only change when a piece lands, so they are
+    # drawn once onto board_surf and that is blitted every frame. Set it
+    # to None after changing the board to have it drawn again.
+    board_surf = None
+    pieces_drawn = 0 # engine.pieces when board_surf was drawn
 
     while True: # main game loop
-        if falling_piece == None:
-            # No falling piece in play, so start a new piece at the top
-            falling_piece = next_piece
-            next_piece = get_new_piece()
-            last_fall_time = time.time() # reset last_fall_time
-
-            if not is_valid_position(board, falling_piece):
-                return # can't fit a new piece on the board, so game over
-
         check_for_quit()
 
+        inputs = [] # (pressed, action) for each key pressed or released this frame
         for event in pygame.event.get(): # event handling loop
             if event.type == KEYUP:
                 if (event.key == K_p):
@@ -205,99 +105,52 @@ def run_game():
                     pygame.mixer.music.stop()
                     show_text_screen('Paused') # pause until a key press
                     pygame.mixer.music.play(-1, 0.0)
-                    last_fall_time = time.time()
-                    last_move_down_time = time.time()
-                    last_move_sideways_time = time.time()
-                elif (event.key == K_LEFT or event.key == K_a):
-                    moving_left = False
-                elif (event.key == K_RIGHT or event.key == K_d):
-                    moving_right = False
-                elif (event.key == K_DOWN or event.key == K_s):
-                    moving_down = False
-
-            elif event.type == KEYDOWN:
-                # moving the block sideways
-                if (event.key == K_LEFT or event.key == K_a) and is_valid_position(board, falling_piece, adj_x = -1):
-                    falling_piece['x'] -= 1
-                    moving_left = True
-                    moving_right = False
-                    last_move_sideways_time = time.time()
-
-                elif (event.key == K_RIGHT or event.key == K_d) and is_valid_position(board, falling_piece, adj_x = 1):
-                    falling_piece['x'] += 1
-                    moving_right = True
-                    moving_left = False
-                    last_move_sideways_time = time.time()
-
-                # rotating the block (if there is room to rotate)
-                elif (event.key == K_UP or event.key == K_w):
-                    falling_piece['rotation'] = (falling_piece['rotation'] + 1) % len(SHAPES[falling_piece['shape']])
-                    if not is_valid_position(board, falling_piece):
-                        falling_piece['rotation'] = (falling_piece['rotation'] - 1) % len(SHAPES[falling_piece['shape']])
-                elif (event.key == K_q): # rotate the other direction
-                    falling_piece['rotation'] = (falling_piece['rotation'] - 1) % len(SHAPES[falling_piece['shape']])
-                    if not is_valid_position(board, falling_piece):
-                        falling_piece['rotation'] = (falling_piece['rotation'] + 1) % len(SHAPES[falling_piece['shape']])
-
-                # making the block fall faster with the down key
-                elif (event.key == K_DOWN or event.key == K_s):
-                    moving_down = True
-                    if is_valid_position(board, falling_piece, adj_y = 1):
-                        falling_piece['y'] += 1
-                    last_move_down_time = time.time()
-
-                # move the current block all the way down
-                elif event.key == K_SPACE:
-                    moving_down = False
-                    moving_left = False
-                    moving_right = False
-                    for i in range(1, BOARDHEIGHT):
-                        if not is_valid_position(board, falling_piece, adj_y = i):
-                            break
-                    falling_piece['y'] += i - 1
-                    
-        # handle moving the block because of user input
-        if (moving_left or moving_right) and time.time() - last_move_sideways_time > MOVESIDEWAYSFREQ:
-            if moving_left and is_valid_position(board, falling_piece, adj_x =- 1):
-                falling_piece['x'] -= 1
-            elif moving_right and is_valid_position(board, falling_piece, adj_x = 1):
-                falling_piece['x'] += 1
-            last_move_sideways_time = time.time()
-
-        if moving_down and time.time() - last_move_down_time > MOVEDOWNFREQ and is_valid_position(board, falling_piece, adj_y = 1):
-            falling_piece['y'] += 1
-            last_move_down_time = time.time()
-
-        # let the piece fall if it is time to fall
-        if time.time() - last_fall_time > fall_freq:
-            # see if the piece has landed
-            if not is_valid_position(board, falling_piece, adj_y = 1):
-                # falling piece has landed, set it on the board
-                add_to_board(board, falling_piece)
-                score += remove_complete_lines(board)
-                level, fall_freq = calculate_level_and_fall_freq(score)
-                falling_piece = None
-            else:
-                # piece did not land, just move the block down
-                falling_piece['y'] += 1
-                last_fall_time = time.time()
+                    inputs.append((True, PAUSE))
+                elif event.key in KEYACTIONS:
+                    inputs.append((False, KEYACTIONS[event.key]))
+            elif event.type == KEYDOWN and event.key in KEYACTIONS:
+                inputs.append((True, KEYACTIONS[event.key]))
+
+        if RECORDING != None:
+            for pressed, action in inputs:
+                RECORDING['inputs'].append((engine.ticks, pressed, action))
+        engine.run_frame(inputs)
+        if RECORDING != None:
+            RECORDING['ticks'] = engine.ticks
+            RECORDING['score'] = engine.score
+        if engine.done:
+            save_recording()
+            return # can't fit a new piece on the board, so game over
 
         # drawing everything on the screen
         DISPLAYSURF.fill(BGCOLOR)
-        draw_board(board)
-        draw_status(score, level)
-        draw_next_piece(next_piece)
-        if falling_piece != None:
-            draw_piece(falling_piece)
+        if board_surf == None or pieces_drawn != engine.pieces:
+            board_surf = make_board_surface(engine.board)
+            pieces_drawn = engine.pieces
+        DISPLAYSURF.blit(board_surf, BOARDRECT)
+        draw_status(engine.score, engine.level)
+        draw_next_piece(engine.next_piece)
+        if engine.falling_piece != None:
+            draw_ghost_piece(engine.board, engine.falling_piece)
+            draw_piece(engine.falling_piece)
 
         pygame.display.update()
         FPSCLOCK.tick(FPS)
 
+def save_recording():
+    # Write the game being recorded to the end of the record file.
+    global RECORDING
+    if RECORDING != None:
+        write_recording(RECORDFILE, RECORDING)
+        RECORDFILE.flush()
+        RECORDING = None
+
 def make_text_objs(text, font, color):
     surf = font.render(text, True, color)
     return surf, surf.get_rect()
 
 def terminate():
+    save_recording() # keep the game that was quit in the middle
     pygame.quit()
     sys.exit()
 
@@ -343,111 +196,51 @@ def check_for_quit():
             terminate() # terminate if the KEYUP event was for the Esc key
         pygame.event.post(event) # put the other KEYUP event objects back
 
-def calculate_level_and_fall_freq(score):
-    # Based on the score, return the level the player is on and
-    # how many seconds pass until a falling piece falls one space.
-    level = int(score / 10) + 1
-    fail_freq = 0.27 - (level * 0.02)
-    return level, fail_freq
-
-def get_new_piece():
-    # return a random new piece in a random rotation and color
-    shape = random.choice(list(SHAPES.keys()))
-    new_piece = {'shape': shape,
-                 'rotation': random.randint(0, len(SHAPES[shape]) - 1),
-                 'x': int(BOARDWIDTH / 2) - int(TEMPLATEWIDTH / 2),
-                 'y': -2,
-                 'color': random.randint(0, len(COLORS) - 1)}
-    return new_piece
-
-def add_to_board(board, piece):
-    # fill in the board based on piece's location, shape, and rotation
-    for x in range(TEMPLATEWIDTH):
-        for y in range(TEMPLATEHEIGHT):
-            if SHAPES[piece['shape']][piece['rotation']][y][x] != BLANK:
-                board[x + piece['x']][y + piece['y']] = piece['color']
-
-def get_blank_board():
-    # create and return a new blank board data structure
-    board = []
-    for i in range(BOARDWIDTH):
-        board.append([BLANK] * BOARDHEIGHT)
-    return board
-
-def is_on_board(x, y):
-    return x >= 0 and x < BOARDWIDTH and y < BOARDHEIGHT
-
-def is_valid_position(board, piece, adj_x=0, adj_y=0):
-    # Return True if the piece is within the board and not colliding
-    for x in range(TEMPLATEWIDTH):
-        for y in range(TEMPLATEHEIGHT):
-            is_above_board = y + piece['y'] + adj_y < 0
-            if is_above_board or SHAPES[piece['shape']][piece['rotation']][y][x] == BLANK:
-                continue
-            if not is_on_board(x + piece['x'] + adj_x, y + piece['y'] + adj_y):
-                return False
-            if board[x + piece['x'] + adj_x][y + piece['y'] + adj_y] != BLANK:
-                return False
-    return True
-
-def is_complete_line(board, y):
-    # Return True if the line filled with boxes with no gaps.
-    for x in range(BOARDWIDTH):
-        if board[x][y] == BLANK:
-            return False
-    return True
-
-def remove_complete_lines(board):
-    # Remove any completed lines on the board, move everything above them down,
-    # and return the number of complete lines.
-    num_lines_removed = 0
-    y = BOARDHEIGHT - 1 # start y at the bottom of the board
-
-    while y >= 0:
-        if is_complete_line(board, y):
-            # Remove the line and pull boxes down by one line.
-            for pull_down_y in range(y, 0, -1):
-                for x in range(BOARDWIDTH):
-                    board[x][pull_down_y] = board[x][pull_down_y-1]
-            # Set very top line to blank.
-            for x in range(BOARDWIDTH):
-                board[x][0] = BLANK
-            num_lines_removed += 1
-            # Note on the next iteration of the loop, y is the same.
-            # This is so that if the line that was pulled down is also
-            # complete, it will be removed.
-        else:
-            y -= 1 # move on to check next row up
-    return num_lines_removed
-
 def convert_to_pixel_coords(boxx, boxy):
     # Convert the given xy coordinates of the board to xy
     # coordinates of the location on the screen.
     return (XMARGIN + (boxx * BOXSIZE)), (TOPMARGIN + (boxy * BOXSIZE))
 
-def draw_box(boxx, boxy, color, pixelx=None, pixely=None):
+def draw_box(boxx, boxy, color, pixelx=None, pixely=None, surf=None):
     # draw a single box (each tetromino piece has four boxes)
     # at xy coordinates on the board. Or, if pixelx & pixely
     # are specified, draw to the pixel coordinates stored in
     # pixelx & pixely (this is used for the "Next" piece).
+    # The box is drawn on surf, or on DISPLAYSURF if surf isn't given.
     if color == BLANK:
         return
+    if surf == None:
+        surf = DISPLAYSURF
     if pixelx == None and pixely == None:
         pixelx, pixely = convert_to_pixel_coords(boxx, boxy)
-    pygame.draw.rect(DISPLAYSURF, COLORS[color], (pixelx + 1, pixely + 1, BOXSIZE - 1, BOXSIZE - 1))
-    pygame.draw.rect(DISPLAYSURF, LIGHTCOLORS[color], (pixelx + 1, pixely + 1, BOXSIZE - 4, BOXSIZE - 4))
+    pygame.draw.rect(surf, COLORS[color], (pixelx + 1, pixely + 1, BOXSIZE - 1, BOXSIZE - 1))
+    pygame.draw.rect(surf, LIGHTCOLORS[color], (pixelx + 1, pixely + 1, BOXSIZE - 4, BOXSIZE - 4))
+
+def draw_board(board, surf=None, surf_topleft=(0, 0)):
+    # Draw the board on surf (DISPLAYSURF if surf isn't given), where the
+    # top left corner of surf is at surf_topleft on the screen.
+    if surf == None:
+        surf = DISPLAYSURF
+    left, top = surf_topleft
 
-def draw_board(board):
     # draw the border around the board
-    pygame.draw.rect(DISPLAYSURF, BOARDERCOLOR, (XMARGIN - 3, TOPMARGIN - 7, (BOARDWIDTH * BOXSIZE) + 8, (BOARDHEIGHT * BOXSIZE) + 8), 5)
+    pygame.draw.rect(surf, BOARDERCOLOR, BOARDRECT.move(-left, -top), 5)
 
     # fill the background of the board
-    pygame.draw.rect(DISPLAYSURF, BGCOLOR, (XMARGIN, TOPMARGIN, BOXSIZE * BOARDWIDTH, BOXSIZE * BOARDHEIGHT))
+    pygame.draw.rect(surf, BGCOLOR, (XMARGIN - left, TOPMARGIN - top, BOXSIZE * BOARDWIDTH, BOXSIZE * BOARDHEIGHT))
 
     # draw the individual boxes on the board
     for x in range(BOARDWIDTH):
         for y in range(BOARDHEIGHT):
-            draw_box(x, y, board[x][y])
+            pixelx, pixely = convert_to_pixel_coords(x, y)
+            draw_box(None, None, board[x][y], pixelx - left, pixely - top, surf)
+
+def make_board_surface(board):
+    # Return a surface the size of BOARDRECT with the board drawn on it.
+    surf = pygame.Surface(BOARDRECT.size).convert()
+    surf.fill(BGCOLOR)
+    draw_board(board, surf, BOARDRECT.topleft)
+    return surf
 
 def draw_status(score, level):
     # draw the score text
@@ -463,17 +256,22 @@ def draw_status(score, level):
     DISPLAYSURF.blit(level_surf, level_rect)
 
 def draw_piece(piece, pixelx=None, pixely=None):
-    shape_to_draw = SHAPES[piece['shape']][piece['rotation']]
     if pixelx == None and pixely == None:
         # if pixelx & pixely hasn't been specified, use the location stored
         # in the piece data structure.
         pixelx, pixely = convert_to_pixel_coords(piece['x'], piece['y'])
 
     # draw each of the blocks that make up the piece
-    for x in range(TEMPLATEWIDTH):
-        for y in range(TEMPLATEHEIGHT):
-            if shape_to_draw[y][x] != BLANK:
-                draw_box(None, None, piece['color'], pixelx + (x * BOXSIZE), pixely + (y * BOXSIZE))
+    for x, y in SHAPE_CELLS[piece['shape']][piece['rotation']]:
+        draw_box(None, None, piece['color'], pixelx + (x * BOXSIZE), pixely + (y * BOXSIZE))
+
+def draw_ghost_piece(board, piece):
+    # draw the outline of the piece where it would land if dropped
+    ghost_y = get_drop_y(board, piece)
+    pixelx, pixely = convert_to_pixel_coords(piece['x'], ghost_y)
+    for x, y in SHAPE_CELLS[piece['shape']][piece['rotation']]:
+        if y + ghost_y >= 0:
+            pygame.draw.rect(DISPLAYSURF, LIGHTCOLORS[piece['color']], (pixelx + (x * BOXSIZE) + 1, pixely + (y * BOXSIZE) + 1, BOXSIZE - 1, BOXSIZE - 1), 1)
 
 def draw_next_piece(piece):
     # draw the "next" text
@@ -0,0 +1,240 @@
+# Tetromino AI
+# Plays Tetromino by searching every placement of the falling piece and the
+# next piece, and runs tournaments of seeded games on a process pool.
+# Creative Commons BY-NC-SA 3.0 US
+
+import os, time, argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from tetromino_engine import *
+
+# The AI only cares where the boxes are, not their colors, so it works on
+# the row masks of a BitBoard (bit x of rows[y] is set if there is a box
+# at x, y) and the SHAPE_ROW_MASKS of the pieces.
+FULL_ROW = (1 << BOARDWIDTH) - 1
+
+# How much each feature of a board is worth. These are the weights from
+# Yiyuan Lee's Tetris AI, which clears lines for a very long time.
+DEFAULT_WEIGHTS = {'height': -0.510066,    # sum of the column heights
+                   'lines': 0.760666,      # lines removed by the placements
+                   'holes': -0.35663,      # empty spaces with a box above them
+                   'bumpiness': -0.184483} # sum of the height differences of next-door columns
+
+MAX_PIECES = 10000 # default number of pieces before a tournament game is stopped
+
+def get_placed_masks(row_masks, piece_x):
+    # Return the row masks of a piece template moved piece_x columns over,
+    # and the lowest template row with a box in it. Returns None if any box
+    # would be off the side of the board.
+    placed = []
+    for y, mask in row_masks:
+        if piece_x < 0:
+            if mask & ((1 << -piece_x) - 1):
+                return None
+            mask >>= -piece_x
+        else:
+            mask <<= piece_x
+            if mask > FULL_ROW:
+                return None
+        placed.append((y, mask))
+    return tuple(placed), row_masks[-1][0]
+
+def compile_placements(shape_row_masks):
+    # Return a dict that maps each shape to a list with an entry per
+    # rotation, which is a dict mapping every column the piece can be in
+    # to its (placed row masks, lowest row).
+    placements = {}
+    for shape, rotations in shape_row_masks.items():
+        placements[shape] = []
+        for row_masks in rotations:
+            columns = {}
+            for piece_x in range(1 - TEMPLATEWIDTH, BOARDWIDTH):
+                placed = get_placed_masks(row_masks, piece_x)
+                if placed != None:
+                    columns[piece_x] = placed
+            placements[shape].append(columns)
+    return placements
+
+# Made once when the program starts, so the search doesn't have to shift
+# the row masks of the pieces over again for every board.
+PLACEMENTS = compile_placements(SHAPE_ROW_MASKS)
+
+def fits(rows, placed, piece_y):
+    # Return True if the placed row masks don't hit the bottom of the board
+    # or any boxes when the piece is at piece_y.
+    for y, mask in placed:
+        row_y = y + piece_y
+        if row_y < 0:
+            continue
+        if row_y >= BOARDHEIGHT or rows[row_y] & mask:
+            return False
+    return True
+
+def get_placements(rows, piece):
+    # Return a list of (rotation, piece_x, piece_y, placed row masks) for
+    # every place the piece can be dropped to. Only the rotations and
+    # columns that the piece can get to from where it is, by moving left
+    # and right and rotating at its starting height like the keys do in
+    # the game, are used.
+    rotations = PLACEMENTS[piece['shape']]
+    start_y = piece['y']
+    start = (piece['rotation'], piece['x'])
+    if piece['x'] not in rotations[piece['rotation']] or not fits(rows, rotations[piece['rotation']][piece['x']][0], start_y):
+        return []
+    reached = [start]
+    seen = set(reached)
+    for rotation, piece_x in reached: # reached grows as the search goes
+        for next_rotation, next_x in ((rotation, piece_x - 1),
+                                      (rotation, piece_x + 1),
+                                      ((rotation + 1) % len(rotations), piece_x),
+                                      ((rotation - 1) % len(rotations), piece_x)):
+            if (next_rotation, next_x) in seen or next_x not in rotations[next_rotation]:
+                continue
+            if fits(rows, rotations[next_rotation][next_x][0], start_y):
+                seen.add((next_rotation, next_x))
+                reached.append((next_rotation, next_x))
+
+    placements = []
+    # the piece can fall freely down to just above the highest box
+    top = 0
+    while top < BOARDHEIGHT and not rows[top]:
+        top += 1
+    for rotation, piece_x in reached:
+        placed, lowest_row = rotations[rotation][piece_x]
+        piece_y = max(start_y, top - 1 - lowest_row)
+        while fits(rows, placed, piece_y + 1):
+            piece_y += 1
+        placements.append((rotation, piece_x, piece_y, placed))
+    return placements
+
+def place(rows, placed, piece_y):
+    # Return the new rows after setting the piece at piece_y and removing
+    # complete lines, and the number of lines removed. Returns None, 0 if
+    # the piece would stick out of the top of the board.
+    new_rows = rows[:]
+    for y, mask in placed:
+        row_y = y + piece_y
+        if row_y < 0:
+            return None, 0
+        new_rows[row_y] |= mask
+    num_lines = new_rows.count(FULL_ROW)
+    if num_lines:
+        new_rows = [0] * num_lines + [row for row in new_rows if row != FULL_ROW]
+    return new_rows, num_lines
+
+def evaluate(rows, lines, weights):
+    # Return the weighted score of a board. Higher is better.
+    heights = [0] * BOARDWIDTH
+    holes = 0
+    covered = 0 # a mask of the columns that have a box somewhere above
+    for y in range(BOARDHEIGHT):
+        row = rows[y]
+        if not row and not covered:
+            continue # still above the stack
+        new_columns = row & ~covered
+        while new_columns:
+            bit = new_columns & -new_columns
+            heights[bit.bit_length() - 1] = BOARDHEIGHT - y
+            new_columns ^= bit
+        covered |= row
+        holes += bin(covered & ~row).count('1')
+
+    bumpiness = 0
+    for x in range(BOARDWIDTH - 1):
+        bumpiness += abs(heights[x] - heights[x + 1])
+
+    return (weights['height'] * sum(heights) +
+            weights['lines'] * lines +
+            weights['holes'] * holes +
+            weights['bumpiness'] * bumpiness)
+
+def choose_placement(board, piece, next_piece, weights=DEFAULT_WEIGHTS):
+    # Return the (rotation, piece_x) to drop the piece at, looking at every
+    # placement of the piece followed by every placement of next_piece.
+    # Returns None if the piece doesn't fit anywhere.
+    best_score = None
+    best_placement = None
+    for rotation, piece_x, piece_y, placed in get_placements(board.rows, piece):
+        rows, lines = place(board.rows, placed, piece_y)
+        if rows == None:
+            continue
+        # The score of this placement is the best the next piece can do
+        # after it. If the next piece can't go anywhere, this placement
+        # still beats dropping the piece somewhere that ends the game.
+        score = None
+        for next_rotation, next_x, next_y, next_placed in get_placements(rows, next_piece):
+            next_rows, next_lines = place(rows, next_placed, next_y)
+            if next_rows == None:
+                continue
+            next_score = evaluate(next_rows, lines + next_lines, weights)
+            if score == None or next_score > score:
+                score = next_score
+        if score == None:
+            score = evaluate(rows, lines, weights) - 1000000
+        if best_score == None or score > best_score:
+            best_score = score
+            best_placement = (rotation, piece_x)
+    return best_placement
+
+def play_game(seed, weights=DEFAULT_WEIGHTS, max_pieces=MAX_PIECES):
+    # Play one game with the AI on a TetrominoEngine and return a dict with
+    # the 'seed', 'lines', 'pieces', 'time' and the slowest decision in
+    # 'max_decision_time' (all times in seconds).
+    engine = TetrominoEngine()
+    state = engine.reset(seed)
+    lines = 0
+    pieces = 0
+    max_decision_time = 0.0
+    start_time = time.time()
+    done = False
+    while not done and pieces < max_pieces:
+        decision_start_time = time.time()
+        placement = choose_placement(state['board'], state['falling_piece'], state['next_piece'], weights)
+        max_decision_time = max(max_decision_time, time.time() - decision_start_time)
+        if placement == None:
+            break # nowhere to put the piece, so game over
+
+        # turn the piece and move it over (get_placements() only gives
+        # places it can get to), then drop it, like a player pressing the
+        # keys very fast
+        state['falling_piece']['rotation'], state['falling_piece']['x'] = placement
+        state, step_lines, done = engine.step(DROP)
+        lines += step_lines
+        pieces += 1
+    return {'seed': seed,
+            'lines': lines,
+            'pieces': pieces,
+            'time': time.time() - start_time,
+            'max_decision_time': max_decision_time}
+
+def main():
+    parser = argparse.ArgumentParser(description='Play seeded Tetromino games with the AI.')
+    parser.add_argument('--games', type=int, default=20, help='number of games to play')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game, the rest count up from it')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--max-pieces', type=int, default=MAX_PIECES, help='stop each game after this many pieces')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    seeds = range(args.seed, args.seed + args.games)
+    total_lines = 0
+    total_pieces = 0
+    total_game_time = 0.0
+    max_decision_time = 0.0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        results = executor.map(play_game, seeds, [DEFAULT_WEIGHTS] * args.games, [args.max_pieces] * args.games)
+        for result in results:
+            total_lines += result['lines']
+            total_pieces += result['pieces']
+            total_game_time += result['time']
+            max_decision_time = max(max_decision_time, result['max_decision_time'])
+            print('Game %s: %s lines, %s pieces, %.2f seconds' % (result['seed'], result['lines'], result['pieces'], result['time']))
+
+    wall_time = time.time() - start_time
+    print('Average %.1f lines and %.1f pieces per game over %s games.' % (total_lines / args.games, total_pieces / args.games, args.games))
+    if total_game_time > 0:
+        print('%.0f pieces per second per worker, %.0f pieces per second with %s workers.' % (total_pieces / total_game_time, total_pieces / wall_time, args.workers))
+    print('Slowest decision took %.1f ms (one frame at %s FPS is %.1f ms).' % (max_decision_time * 1000, FPS, 1000.0 / FPS))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+# Tetromino Batch
+# Plays hundreds of Tetromino games at once, with the boards in one NumPy
+# array, for training bots.
+# Creative Commons BY-NC-SA 3.0 US
+
+import random
+import numpy
+
+from tetromino_engine import *
+
+"""
+TetrominoBatch plays the same game as TetrominoEngine.step(), for a whole
+batch of games at once:
+
+    batch = TetrominoBatch(500)
+    state = batch.reset(seed)
+    state, lines, done = batch.step(actions)
+
+actions is an array with an index into ACTIONS for each game. lines and
+done are arrays with the lines removed by the step and whether each game
+is over. Games that are over don't change until they are reset with
+reset_games(). Game i with seed s gets the same pieces as
+TetrominoEngine.reset(s), and given the same actions it plays out exactly
+the same way.
+
+The state is a dictionary of arrays, with one entry for each game:
+    'boards' - a uint8 array of shape (N, BOARDWIDTH, BOARDHEIGHT). 0 is a blank space, otherwise it is the box's color + 1.
+    'shapes', 'rotations', 'x', 'y', 'colors' - the falling piece. The shape is an index into SHAPE_NAMES.
+    'next_shapes', 'next_rotations', 'next_colors' - the next piece.
+    'score', 'level', 'fall_freq', 'pieces', 'ticks', 'done' - the same as in TetrominoEngine.
+The arrays are the batch's own, so copy them to keep them past the next step.
+"""
+
+SHAPE_NAMES = tuple(SHAPES) # shape index -> shape letter
+NUM_ROTATIONS = numpy.array([len(SHAPES[shape]) for shape in SHAPE_NAMES])
+
+def make_cell_table(shape_cells):
+    # Return an int array of shape (shapes, 4, 4, 2) with the (x, y) of the 4
+    # boxes of each shape and rotation. Shapes with fewer than 4 rotations
+    # repeat them, so any rotation modulo 4 can be looked up.
+    table = numpy.zeros((len(SHAPE_NAMES), 4, 4, 2), dtype=numpy.int64)
+    for shape_index in range(len(SHAPE_NAMES)):
+        rotations = shape_cells[SHAPE_NAMES[shape_index]]
+        for rotation in range(4):
+            table[shape_index, rotation] = rotations[rotation % len(rotations)]
+    return table
+
+CELL_TABLE = make_cell_table(SHAPE_CELLS)
+
+ACTION_INDEXES = dict((ACTIONS[i], i) for i in range(len(ACTIONS)))
+
+class TetrominoBatch(object):
+
+    def __init__(self, num_games):
+        self.num_games = num_games
+        self.boards = numpy.zeros((num_games, BOARDWIDTH, BOARDHEIGHT), dtype=numpy.uint8)
+        self.shapes = numpy.zeros(num_games, dtype=numpy.int64)
+        self.rotations = numpy.zeros(num_games, dtype=numpy.int64)
+        self.x = numpy.zeros(num_games, dtype=numpy.int64)
+        self.y = numpy.zeros(num_games, dtype=numpy.int64)
+        self.colors = numpy.zeros(num_games, dtype=numpy.int64)
+        self.next_shapes = numpy.zeros(num_games, dtype=numpy.int64)
+        self.next_rotations = numpy.zeros(num_games, dtype=numpy.int64)
+        self.next_colors = numpy.zeros(num_games, dtype=numpy.int64)
+        self.score = numpy.zeros(num_games, dtype=numpy.int64)
+        self.level = numpy.zeros(num_games, dtype=numpy.int64)
+        self.fall_freq = numpy.zeros(num_games)
+        self.pieces = numpy.zeros(num_games, dtype=numpy.int64)
+        self.ticks = numpy.zeros(num_games, dtype=numpy.int64)
+        self.last_fall_tick = numpy.zeros(num_games, dtype=numpy.int64)
+        self.done = numpy.ones(num_games, dtype=bool)
+        self.rngs = [None] * num_games # a random.Random for each game's pieces
+        self.next_pieces = [None] * num_games # the next piece dicts, to start them from
+
+    def reset(self, seed=None):
+        # Start every game again and return the state. Game i is seeded
+        # with seed + i, or randomly if seed is None.
+        if seed == None:
+            seeds = [None] * self.num_games
+        else:
+            seeds = [seed + i for i in range(self.num_games)]
+        self.reset_games(range(self.num_games), seeds)
+        return self.get_state()
+
+    def reset_games(self, indexes, seeds):
+        # Start the games at the given indexes again, each with its seed.
+        for i, seed in zip(indexes, seeds):
+            self.rngs[i] = random.Random(None if seed == None else int(seed))
+            self.boards[i] = 0
+            self.score[i] = 0
+            self.level[i], self.fall_freq[i] = calculate_level_and_fall_freq(0)
+            self.pieces[i] = 0
+            self.ticks[i] = 0
+            self.last_fall_tick[i] = 0
+            self.done[i] = False
+            self.set_piece(i, get_new_piece(self.rngs[i]))
+            self.set_next_piece(i, get_new_piece(self.rngs[i]))
+
+    def set_piece(self, i, piece):
+        self.shapes[i] = SHAPE_NAMES.index(piece['shape'])
+        self.rotations[i] = piece['rotation']
+        self.x[i] = piece['x']
+        self.y[i] = piece['y']
+        self.colors[i] = piece['color']
+
+    def set_next_piece(self, i, piece):
+        self.next_pieces[i] = piece
+        self.next_shapes[i] = SHAPE_NAMES.index(piece['shape'])
+        self.next_rotations[i] = piece['rotation']
+        self.next_colors[i] = piece['color']
+
+    def get_state(self):
+        return {'boards': self.boards,
+                'shapes': self.shapes,
+                'rotations': self.rotations,
+                'x': self.x,
+                'y': self.y,
+                'colors': self.colors,
+                'next_shapes': self.next_shapes,
+                'next_rotations': self.next_rotations,
+                'next_colors': self.next_colors,
+                'score': self.score,
+                'level': self.level,
+                'fall_freq': self.fall_freq,
+                'pieces': self.pieces,
+                'ticks': self.ticks,
+                'done': self.done}
+
+    def get_cells(self, games, rotations, x, y):
+        # Return the board x and y arrays, each of shape (len(games), 4), of
+        # the boxes of the falling pieces of the given games if they were at
+        # the given rotations and positions.
+        cells = CELL_TABLE[self.shapes[games], rotations % 4]
+        return cells[:, :, 0] + x[:, None], cells[:, :, 1] + y[:, None]
+
+    def is_valid_position(self, games, rotations, x, y):
+        # Return a bool array of whether the falling pieces of the given
+        # games would be within their boards and not colliding, at the
+        # given rotations and positions. The same rules as
+        # is_valid_position(): boxes above the board are not checked.
+        cells_x, cells_y = self.get_cells(games, rotations, x, y)
+        above_board = cells_y < 0
+        on_board = (cells_x >= 0) & (cells_x < BOARDWIDTH) & (cells_y < BOARDHEIGHT)
+        # look up every box, using 0, 0 for the ones that aren't on the board
+        check = on_board & ~above_board
+        boxes = self.boards[games[:, None], numpy.where(check, cells_x, 0), numpy.where(check, cells_y, 0)]
+        ok = above_board | (on_board & (boxes == 0))
+        return ok.all(axis=1)
+
+    def step(self, actions):
+        # Play one frame of every game that isn't over, with the action
+        # index for each game. Returns the state, the lines removed and
+        # whether each game is over.
+        actions = numpy.asarray(actions)
+        lines = numpy.zeros(self.num_games, dtype=numpy.int64)
+        playing = ~self.done
+
+        # moving the block sideways
+        adj_x = numpy.where(actions == ACTION_INDEXES[LEFT], -1, numpy.where(actions == ACTION_INDEXES[RIGHT], 1, 0))
+        games = numpy.flatnonzero(playing & (adj_x != 0))
+        valid = self.is_valid_position(games, self.rotations[games], self.x[games] + adj_x[games], self.y[games])
+        self.x[games[valid]] += adj_x[games[valid]]
+
+        # rotating the block (if there is room to rotate)
+        adj_rotation = numpy.where(actions == ACTION_INDEXES[ROTATE], 1, numpy.where(actions == ACTION_INDEXES[ROTATE_BACK], -1, 0))
+        games = numpy.flatnonzero(playing & (adj_rotation != 0))
+        rotations = (self.rotations[games] + adj_rotation[games]) % NUM_ROTATIONS[self.shapes[games]]
+        valid = self.is_valid_position(games, rotations, self.x[games], self.y[games])
+        self.rotations[games[valid]] = rotations[valid]
+
+        # making the block fall faster with the down key
+        games = numpy.flatnonzero(playing & (actions == ACTION_INDEXES[DOWN]))
+        valid = self.is_valid_position(games, self.rotations[games], self.x[games], self.y[games] + 1)
+        self.y[games[valid]] += 1
+
+        # move the current block all the way down and set it on the board
+        dropping = playing & (actions == ACTION_INDEXES[DROP])
+        games = numpy.flatnonzero(dropping)
+        while len(games):
+            valid = self.is_valid_position(games, self.rotations[games], self.x[games], self.y[games] + 1)
+            games = games[valid]
+            self.y[games] += 1
+        landing = dropping.copy()
+
+        # let the piece fall if it is time to fall
+        games = numpy.flatnonzero(playing & ~dropping & (self.ticks - self.last_fall_tick > self.fall_freq * FPS))
+        valid = self.is_valid_position(games, self.rotations[games], self.x[games], self.y[games] + 1)
+        self.y[games[valid]] += 1
+        self.last_fall_tick[games[valid]] = self.ticks[games[valid]]
+        landing[games[~valid]] = True
+
+        self.land_pieces(numpy.flatnonzero(landing), lines)
+        self.ticks[playing] += 1
+        self.start_next_pieces(numpy.flatnonzero(landing & ~self.done))
+        return self.get_state(), lines, self.done
+
+    def land_pieces(self, games, lines):
+        # Set the falling pieces of the given games on their boards, remove
+        # complete lines and put the number removed in lines.
+        cells_x, cells_y = self.get_cells(games, self.rotations[games], self.x[games], self.y[games])
+        # landed sticking out of the top of the board, so game over
+        locked_out = (cells_y < 0).any(axis=1)
+        self.done[games[locked_out]] = True
+        games = games[~locked_out]
+        cells_x = cells_x[~locked_out]
+        cells_y = cells_y[~locked_out]
+
+        self.boards[games[:, None], cells_x, cells_y] = (self.colors[games] + 1)[:, None]
+        self.pieces[games] += 1
+
+        # Remove complete lines by moving each board's complete rows to the
+        # top (a stable sort keeps the other rows in order) and blanking them.
+        complete = (self.boards[games] != 0).all(axis=1)
+        num_lines = complete.sum(axis=1)
+        games = games[num_lines > 0]
+        complete = complete[num_lines > 0]
+        num_lines = num_lines[num_lines > 0]
+        if len(games):
+            order = numpy.argsort(~complete, axis=1, kind='stable')
+            boards = numpy.take_along_axis(self.boards[games], order[:, None, :], axis=2)
+            blank_rows = numpy.arange(BOARDHEIGHT)[None, None, :] < num_lines[:, None, None]
+            self.boards[games] = numpy.where(blank_rows, 0, boards)
+            lines[games] = num_lines
+            self.score[games] += num_lines
+            for i in games:
+                self.level[i], self.fall_freq[i] = calculate_level_and_fall_freq(self.score[i])
+
+    def start_next_pieces(self, games):
+        # Bring in the next piece for the given games. A game is over if the
+        # new piece doesn't fit.
+        for i in games:
+            self.set_piece(i, self.next_pieces[i])
+            self.set_next_piece(i, get_new_piece(self.rngs[i]))
+        self.last_fall_tick[games] = self.ticks[games]
+        valid = self.is_valid_position(games, self.rotations[games], self.x[games], self.y[games])
+        self.done[games[~valid]] = True
@@ -0,0 +1,243 @@
+# Tetromino Benchmarks
+# Times the hot paths of tetromino.py without a window, and compares the
+# results from two checkouts.
+# Creative Commons BY-NC-SA 3.0 US
+
+import os, time, json, random, platform, argparse
+
+# run without a window or sound (this has to be set before pygame starts)
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+from pygame.locals import *
+import tetromino
+
+"""
+Usage:
+    python tetromino_benchmark.py [--output results.json] [--repeat N] [--seed N]
+    python tetromino_benchmark.py --compare old.json new.json
+
+Every benchmark is set up from a fixed seed, so two checkouts time the
+same work. Each one runs its calls --repeat times and keeps the fastest
+run, which is the least disturbed by whatever else the machine is doing.
+The benchmarks only use functions that tetromino.py has always had, so
+this file can be copied into an older checkout to time it too.
+
+The results data structure (also what is saved as JSON) is a dictionary with these keys:
+    'python', 'pygame', 'machine' - what the benchmarks ran on.
+    'seed', 'repeat' - the options used.
+    'results' - a dict mapping each benchmark name to a dict with 'calls' (calls per run) and 'us_per_call' (microseconds per call in the fastest run).
+"""
+
+REPEAT = 5
+SEED = 2024
+CHANGE_THRESHOLD = 0.05 # changes smaller than 5% are reported as the same
+
+SCRIPTED_KEYS = (K_LEFT, K_RIGHT, K_UP, K_q, K_DOWN, K_SPACE)
+
+def get_board_makers():
+    # Return a list of (name, function) for each kind of board this
+    # checkout has.
+    board_makers = [('list', tetromino.get_blank_board)]
+    if hasattr(tetromino, 'get_blank_bitboard'):
+        board_makers.append(('bitboard', tetromino.get_blank_bitboard))
+    return board_makers
+
+def make_random_piece(rng, y_range=(-2, tetromino.BOARDHEIGHT - 1)):
+    shape = rng.choice(sorted(tetromino.SHAPES))
+    return {'shape': shape,
+            'rotation': rng.randrange(len(tetromino.SHAPES[shape])),
+            'x': rng.randint(-2, tetromino.BOARDWIDTH - 3),
+            'y': rng.randint(y_range[0], y_range[1]),
+            'color': rng.randrange(len(tetromino.COLORS))}
+
+def fill_board(board, rng, top_y, chance=0.6):
+    # Put random boxes on the rows from top_y down, leaving at least one
+    # gap in each row so that no line is complete.
+    for y in range(top_y, tetromino.BOARDHEIGHT):
+        gap_x = rng.randrange(tetromino.BOARDWIDTH)
+        for x in range(tetromino.BOARDWIDTH):
+            if x != gap_x and rng.random() < chance:
+                board[x][y] = rng.randrange(len(tetromino.COLORS))
+    return board
+
+def time_calls(run, calls, repeat):
+    # Call run() repeat times and return the fastest time divided by
+    # calls, in microseconds. run() does the calls itself so the loop
+    # overhead is the same in every checkout.
+    best = None
+    for i in range(repeat):
+        start_time = time.perf_counter()
+        run()
+        run_time = time.perf_counter() - start_time
+        if best == None or run_time < best:
+            best = run_time
+    return best * 1000000 / calls
+
+def bench_is_valid_position(make_board, rng, repeat):
+    board = fill_board(make_board(), rng, 8)
+    tests = []
+    for i in range(2000):
+        tests.append((make_random_piece(rng), rng.randint(-1, 1), rng.randint(0, 1)))
+    is_valid_position = tetromino.is_valid_position
+
+    def run():
+        for piece, adj_x, adj_y in tests:
+            is_valid_position(board, piece, adj_x, adj_y)
+    return time_calls(run, len(tests), repeat), len(tests)
+
+def bench_add_to_board(make_board, rng, repeat):
+    # pieces that are on the board, so they can be added to a blank board
+    pieces = []
+    while len(pieces) < 200:
+        piece = make_random_piece(rng, (0, tetromino.BOARDHEIGHT - 1))
+        if tetromino.is_valid_position(make_board(), piece):
+            pieces.append(piece)
+    add_to_board = tetromino.add_to_board
+    boards = [[make_board() for piece in pieces] for i in range(repeat)]
+
+    def run():
+        for board, piece in zip(boards.pop(), pieces):
+            add_to_board(board, piece)
+    return time_calls(run, len(pieces), repeat), len(pieces)
+
+def bench_remove_complete_lines(make_board, rng, repeat):
+    # half-full boards with one to four complete lines
+    def make_full_board():
+        board = fill_board(make_board(), rng, 8)
+        num_lines = rng.randint(1, 4)
+        for y in rng.sample(range(8, tetromino.BOARDHEIGHT), num_lines):
+            for x in range(tetromino.BOARDWIDTH):
+                board[x][y] = 0
+        return board
+    num_boards = 200
+    boards = [[make_full_board() for i in range(num_boards)] for j in range(repeat)]
+    remove_complete_lines = tetromino.remove_complete_lines
+
+    def run():
+        for board in boards.pop():
+            remove_complete_lines(board)
+    return time_calls(run, num_boards, repeat), num_boards
+
+def bench_draw_board(make_board, rng, repeat):
+    board = fill_board(make_board(), rng, 8)
+    calls = 100
+    draw_board = tetromino.draw_board
+
+    def run():
+        for i in range(calls):
+            draw_board(board)
+    return time_calls(run, calls, repeat), calls
+
+class FramesDone(Exception):
+    pass
+
+class ScriptedClock(object):
+    # Stands in for FPSCLOCK in run_game(). Instead of waiting, it posts the
+    # key presses for the next frame, and stops the game after num_frames.
+
+    def __init__(self, rng, num_frames):
+        self.rng = rng
+        self.num_frames = num_frames
+        self.frame = 0
+        self.held_key = None
+
+    def tick(self, framerate=0):
+        self.frame += 1
+        if self.frame >= self.num_frames:
+            raise FramesDone()
+        if self.held_key != None and self.rng.random() < 0.3:
+            pygame.event.post(pygame.event.Event(KEYUP, key=self.held_key, mod=0))
+            self.held_key = None
+        elif self.held_key == None and self.rng.random() < 0.2:
+            self.held_key = self.rng.choice(SCRIPTED_KEYS)
+            pygame.event.post(pygame.event.Event(KEYDOWN, key=self.held_key, mod=0))
+        return 0
+
+def bench_run_game_frame(rng, repeat):
+    # Time whole frames of run_game(), with seeded key presses standing in
+    # for a player. A game that ends is started again.
+    num_frames = 500
+    random_state = random.getstate()
+
+    def run():
+        random.seed(rng.random()) # the pieces in run_game()
+        tetromino.FPSCLOCK = ScriptedClock(random.Random(rng.random()), num_frames)
+        pygame.event.clear()
+        try:
+            while True:
+                tetromino.run_game()
+        except FramesDone:
+            pass
+    us_per_call = time_calls(run, num_frames, repeat)
+    random.setstate(random_state)
+    return us_per_call, num_frames
+
+def run_benchmarks(seed, repeat):
+    pygame.init()
+    tetromino.DISPLAYSURF = pygame.display.set_mode((tetromino.WINDOWWIDTH, tetromino.WINDOWHEIGHT))
+    tetromino.BASICFONT = pygame.font.Font('freesansbold.ttf', 18)
+    tetromino.BIGFONT = pygame.font.Font('freesansbold.ttf', 100)
+
+    results = {}
+    for board_name, make_board in get_board_makers():
+        for name, bench in (('is_valid_position', bench_is_valid_position),
+                            ('add_to_board', bench_add_to_board),
+                            ('remove_complete_lines', bench_remove_complete_lines),
+                            ('draw_board', bench_draw_board)):
+            us_per_call, calls = bench(make_board, random.Random(seed), repeat)
+            results['%s[%s]' % (name, board_name)] = {'us_per_call': us_per_call, 'calls': calls}
+    us_per_call, calls = bench_run_game_frame(random.Random(seed), repeat)
+    results['run_game frame'] = {'us_per_call': us_per_call, 'calls': calls}
+
+    return {'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'machine': platform.machine(),
+            'seed': seed,
+            'repeat': repeat,
+            'results': results}
+
+def print_results(results):
+    for name in sorted(results['results']):
+        print('%-32s %10.2f us' % (name, results['results'][name]['us_per_call']))
+
+def compare_results(old, new):
+    # Print each benchmark in both sets of results and how it changed.
+    print('%-32s %10s %10s %8s' % ('benchmark', 'old us', 'new us', 'change'))
+    for name in sorted(set(old['results']) | set(new['results'])):
+        if name not in old['results'] or name not in new['results']:
+            print('%-32s (only in %s)' % (name, 'new' if name in new['results'] else 'old'))
+            continue
+        old_us = old['results'][name]['us_per_call']
+        new_us = new['results'][name]['us_per_call']
+        change = new_us / old_us - 1
+        if change < -CHANGE_THRESHOLD:
+            verdict = 'faster'
+        elif change > CHANGE_THRESHOLD:
+            verdict = 'SLOWER'
+        else:
+            verdict = 'same'
+        print('%-32s %10.2f %10.2f %+7.1f%% %s' % (name, old_us, new_us, change * 100, verdict))
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the hot paths of Tetromino.')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='runs of each benchmark, the fastest is kept')
+    parser.add_argument('--seed', type=int, default=SEED, help='seed for the boards, pieces and key presses')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two saved JSON results instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as old_file, open(args.compare[1]) as new_file:
+            compare_results(json.load(old_file), json.load(new_file))
+        return
+
+    results = run_benchmarks(args.seed, args.repeat)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
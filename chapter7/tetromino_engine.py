@@ -0,0 +1,679 @@
+# Tetromino (a Tetris clone) - the game without the window
+# By Al Sweigart al@inventwithpython.com
+# http://inventwithpython.com/pygame
+# Creative Commons BY-NC-SA 3.0 US
+
+# The board, the pieces and the rules of Tetromino. Nothing in here uses
+# pygame, so bots and balancing scripts can run games as fast as Python
+# goes with TetrominoEngine. tetromino.py imports all of this.
+
+import random, struct
+
+FPS = 25
+BOARDWIDTH = 10
+BOARDHEIGHT = 20
+BLANK = '.'
+NUM_COLORS = 4 # tetromino.py has the actual colors
+
+MOVESIDEWAYSFREQ = 0.15
+MOVEDOWNFREQ = 0.1
+
+# The actions that TetrominoEngine.step() takes.
+NOOP = 'noop'
+LEFT = 'left'
+RIGHT = 'right'
+ROTATE = 'rotate'
+ROTATE_BACK = 'rotate back'
+DOWN = 'down'
+DROP = 'drop'
+ACTIONS = (NOOP, LEFT, RIGHT, ROTATE, ROTATE_BACK, DOWN, DROP)
+# PAUSE is only used by TetrominoEngine.run_frame(), when the game comes
+# back from being paused.
+PAUSE = 'pause'
+
+# A recording of a game is a header followed by one entry for each key
+# pressed or released. The input code is the action's index in
+# RECORD_ACTIONS * 2, plus 1 if the key was pressed.
+RECORD_MAGIC = b'TREC'
+RECORD_VERSION = 2 # version 1 dropped pieces one row short from 19 rows up
+RECORD_HEADER = struct.Struct('<4sHQIII') # magic, version, seed, number of inputs, ticks, score
+RECORD_INPUT = struct.Struct('<IB') # tick, input code
+RECORD_ACTIONS = ACTIONS + (PAUSE,)
+
+TEMPLATEWIDTH = 5
+TEMPLATEHEIGHT = 5
+
+S_SHAPE_TEMPLATE = [['.....',
+                     '.....',
+                     '..OO.',
+                     '.OO..',
+                     '.....'],
+                    ['.....',
+                     '..O..',
+                     '..OO.',
+                     '...O.',
+                     '.....']]
+Z_SHAPE_TEMPLATE = [['.....',
+                     '.....',
+                     '.OO..',
+                     '..OO.',
+                     '.....'],
+                    ['.....',
+                     '..O..',
+                     '.OO..',
+                     '.O...',
+                     '.....']]
+I_SHAPE_TEMPLATE = [['..O..',
+                     '..O..',
+                     '..O..',
+                     '..O..',
+                     '.....'],
+                    ['.....',
+                     '.....',
+                     'OOOO.',
+                     '.....',
+                     '.....']]
+O_SHAPE_TEMPLATE = [['.....',
+                     '.....',
+                     '.OO..',
+                     '.OO..',
+                     '.....']]
+J_SHAPE_TEMPLATE = [['.....',
+                     '.O...',
+                     '.OOO.',
+                     '.....',
+                     '.....'],
+                    ['.....',
+                     '..OO.',
+                     '..O..',
+                     '..O..',
+                     '.....'],
+                    ['.....',
+                     '.....',
+                     '.OOO.',
+                     '...O.',
+                     '.....'],
+                    ['.....',
+                     '..O..',
+                     '..O..',
+                     '.OO..',
+                     '.....']]
+L_SHAPE_TEMPLATE = [['.....',
+                     '...O.',
+                     '.OOO.',
+                     '.....',
+                     '.....'],
+                    ['.....',
+                     '..O..',
+                     '..O..',
+                     '..OO.',
+                     '.....'],
+                    ['.....',
+                     '.....',
+                     '.OOO.',
+                     '.O...',
+                     '.....'],
+                    ['.....',
+                     '.OO..',
+                     '..O..',
+                     '..O..',
+                     '.....']]
+T_SHAPE_TEMPLATE = [['.....',
+                     '..O..',
+                     '.OOO.',
+                     '.....',
+                     '.....'],
+                    ['.....',
+                     '..O..',
+                     '..OO.',
+                     '..O..',
+                     '.....'],
+                    ['.....',
+                     '.....',
+                     '.OOO.',
+                     '..O..',
+                     '.....'],
+                    ['.....',
+                     '..O..',
+                     '.OO..',
+                     '..O..',
+                     '.....']]
+
+SHAPES = {'S': S_SHAPE_TEMPLATE,
+          'Z': Z_SHAPE_TEMPLATE,
+          'J': J_SHAPE_TEMPLATE,
+          'L': L_SHAPE_TEMPLATE,
+          'I': I_SHAPE_TEMPLATE,
+          'O': O_SHAPE_TEMPLATE,
+          'T': T_SHAPE_TEMPLATE}
+
+def compile_shapes(shapes):
+    # Turn the 5x5 string templates into tables that are quicker to use.
+    # Returns two dicts that map each shape to a list with an entry per
+    # rotation:
+    #   cells - a tuple of the (x, y) template positions of the 4 boxes.
+    #   row masks - a tuple of (y, mask) for each template row that has
+    #               boxes, where bit x of mask is set if there is a box at x.
+    shape_cells = {}
+    shape_row_masks = {}
+    for shape, rotations in shapes.items():
+        shape_cells[shape] = []
+        shape_row_masks[shape] = []
+        for template in rotations:
+            cells = []
+            row_masks = []
+            for y in range(TEMPLATEHEIGHT):
+                mask = 0
+                for x in range(TEMPLATEWIDTH):
+                    if template[y][x] != BLANK:
+                        cells.append((x, y))
+                        mask |= 1 << x
+                if mask:
+                    row_masks.append((y, mask))
+            shape_cells[shape].append(tuple(cells))
+            shape_row_masks[shape].append(tuple(row_masks))
+    return shape_cells, shape_row_masks
+
+# These are made once when the program starts. is_valid_position(),
+# add_to_board() and draw_piece() only look at the 4 boxes of a piece
+# instead of all 25 characters of its template.
+SHAPE_CELLS, SHAPE_ROW_MASKS = compile_shapes(SHAPES)
+
+def get_shape_bottoms(shape_cells):
+    # Return a dict that maps each shape to a list with an entry per
+    # rotation of (x, y) for the lowest box in each template column.
+    shape_bottoms = {}
+    for shape, rotations in shape_cells.items():
+        shape_bottoms[shape] = []
+        for cells in rotations:
+            bottoms = {}
+            for x, y in cells:
+                if y > bottoms.get(x, -1):
+                    bottoms[x] = y
+            shape_bottoms[shape].append(tuple(sorted(bottoms.items())))
+    return shape_bottoms
+
+# Used with the column heights of a BitBoard to find where a piece lands
+# without trying every row on the way down.
+SHAPE_BOTTOMS = get_shape_bottoms(SHAPE_CELLS)
+
+def calculate_level_and_fall_freq(score):
+    # Based on the score, return the level the player is on and
+    # how many seconds pass until a falling piece falls one space.
+    level = int(score / 10) + 1
+    fail_freq = 0.27 - (level * 0.02)
+    return level, fail_freq
+
+def get_new_piece(rng=random):
+    # return a random new piece in a random rotation and color, using the
+    # random module or the random.Random object passed for rng
+    shape = rng.choice(list(SHAPES.keys()))
+    new_piece = {'shape': shape,
+                 'rotation': rng.randint(0, len(SHAPES[shape]) - 1),
+                 'x': int(BOARDWIDTH / 2) - int(TEMPLATEWIDTH / 2),
+                 'y': -2,
+                 'color': rng.randint(0, NUM_COLORS - 1)}
+    return new_piece
+
+def add_to_board(board, piece):
+    # fill in the board based on piece's location, shape, and rotation
+    for x, y in SHAPE_CELLS[piece['shape']][piece['rotation']]:
+        board[x + piece['x']][y + piece['y']] = piece['color']
+
+def get_blank_board():
+    # create and return a new blank board data structure
+    board = []
+    for i in range(BOARDWIDTH):
+        board.append([BLANK] * BOARDHEIGHT)
+    return board
+
+class BitBoard(object):
+    # A board that stores each row as an int, with bit x set if there is a
+    # box at x, next to a colour plane of the colour in each space. Checking
+    # for a complete line is one compare, and removing lines just splices
+    # the row lists. board[x][y] reads and sets spaces like the list of
+    # columns from get_blank_board(), so the drawing code works with both.
+    #
+    # heights[x] is how high the top box of column x is above the bottom
+    # of the board (0 for an empty column). It is kept up to date as
+    # boxes are set and lines removed, for get_drop_y().
+
+    def __init__(self, width=BOARDWIDTH, height=BOARDHEIGHT):
+        self.width = width
+        self.height = height
+        self.full_row = (1 << width) - 1
+        self.rows = [0] * height
+        self.colors = [[BLANK] * width for y in range(height)]
+        self.heights = [0] * width
+
+    def __len__(self):
+        return self.width
+
+    def __getitem__(self, x):
+        if x < 0 or x >= self.width:
+            raise IndexError('board column out of range')
+        return BitBoardColumn(self, x)
+
+    def set_box(self, x, y, color):
+        self.colors[y][x] = color
+        if color == BLANK:
+            self.rows[y] &= ~(1 << x)
+            if self.height - y == self.heights[x]:
+                self.update_height(x) # removed the top box of the column
+        else:
+            self.rows[y] |= 1 << x
+            if self.height - y > self.heights[x]:
+                self.heights[x] = self.height - y
+
+    def update_height(self, x):
+        # Find the top box of column x again, looking down from its old top.
+        bit = 1 << x
+        y = self.height - self.heights[x]
+        while y < self.height and not self.rows[y] & bit:
+            y += 1
+        self.heights[x] = self.height - y
+
+    def get_drop_y(self, shape, rotation, piece_x):
+        # Return the y a piece at piece_x lands at when dropped from above
+        # the top of the stack, using the column heights. Returns None if
+        # any column of the piece is off the board.
+        drop_y = self.height
+        for x, bottom in SHAPE_BOTTOMS[shape][rotation]:
+            column = x + piece_x
+            if column < 0 or column >= self.width:
+                return None
+            y = self.height - self.heights[column] - 1 - bottom
+            if y < drop_y:
+                drop_y = y
+        return drop_y
+
+    def fits(self, shape, rotation, piece_x, piece_y):
+        # Return True if the piece is within the board and not colliding,
+        # testing a whole template row at a time against the board's rows.
+        for y, mask in SHAPE_ROW_MASKS[shape][rotation]:
+            row_y = y + piece_y
+            if row_y < 0:
+                continue # boxes above the board can be anywhere
+            if row_y >= self.height:
+                return False
+            if piece_x < 0:
+                if mask & ((1 << -piece_x) - 1):
+                    return False # off the left edge
+                mask >>= -piece_x
+            else:
+                mask <<= piece_x
+            if mask > self.full_row or mask & self.rows[row_y]:
+                return False
+        return True
+
+    def is_complete_line(self, y):
+        return self.rows[y] == self.full_row
+
+    def remove_complete_lines(self):
+        # Remove the complete lines, put blank lines on top for each one, and
+        # return the number of lines removed.
+        keep = [y for y in range(self.height) if self.rows[y] != self.full_row]
+        num_lines_removed = self.height - len(keep)
+        if num_lines_removed:
+            # Every removed line is at or below the top of every column, so
+            # the columns just get that much shorter, unless a removed line
+            # was the top of a column. Then the new top is further down.
+            top_removed = [x for x in range(self.width) if self.rows[self.height - self.heights[x]] == self.full_row]
+            self.rows = [0] * num_lines_removed + [self.rows[y] for y in keep]
+            self.colors = [[BLANK] * self.width for i in range(num_lines_removed)] + [self.colors[y] for y in keep]
+            for x in range(self.width):
+                self.heights[x] -= num_lines_removed
+            for x in top_removed:
+                self.update_height(x)
+        return num_lines_removed
+
+class BitBoardColumn(object):
+    # The board[x] part of board[x][y] for a BitBoard.
+
+    def __init__(self, board, x):
+        self.board = board
+        self.x = x
+
+    def __len__(self):
+        return self.board.height
+
+    def __getitem__(self, y):
+        return self.board.colors[y][self.x]
+
+    def __setitem__(self, y, color):
+        self.board.set_box(self.x, y, color)
+
+def get_blank_bitboard():
+    # create and return a new blank BitBoard
+    return BitBoard(BOARDWIDTH, BOARDHEIGHT)
+
+def is_on_board(x, y):
+    return x >= 0 and x < BOARDWIDTH and y < BOARDHEIGHT
+
+def is_valid_position(board, piece, adj_x=0, adj_y=0):
+    # Return True if the piece is within the board and not colliding
+    if isinstance(board, BitBoard):
+        return board.fits(piece['shape'], piece['rotation'], piece['x'] + adj_x, piece['y'] + adj_y)
+    piece_x = piece['x'] + adj_x
+    piece_y = piece['y'] + adj_y
+    for x, y in SHAPE_CELLS[piece['shape']][piece['rotation']]:
+        is_above_board = y + piece_y < 0
+        if is_above_board:
+            continue
+        if not is_on_board(x + piece_x, y + piece_y):
+            return False
+        if board[x + piece_x][y + piece_y] != BLANK:
+            return False
+    return True
+
+def get_drop_y(board, piece):
+    # Return the y that the piece lands at if it is dropped straight down
+    # from where it is. This only needs the column heights of a BitBoard,
+    # unless the piece is already below the top of a column (under an
+    # overhang), where it has to check each row on the way down.
+    piece_y = piece['y']
+    if isinstance(board, BitBoard):
+        drop_y = board.get_drop_y(piece['shape'], piece['rotation'], piece['x'])
+        if drop_y != None and drop_y >= piece_y:
+            return drop_y
+    drop_y = piece_y
+    while is_valid_position(board, piece, adj_y=drop_y - piece_y + 1):
+        drop_y += 1
+    return drop_y
+
+def is_complete_line(board, y):
+    # Return True if the line filled with boxes with no gaps.
+    if isinstance(board, BitBoard):
+        return board.is_complete_line(y)
+    for x in range(BOARDWIDTH):
+        if board[x][y] == BLANK:
+            return False
+    return True
+
+def remove_complete_lines(board):
+    # Remove any completed lines on the board, move everything above them down,
+    # and return the number of complete lines.
+    if isinstance(board, BitBoard):
+        return board.remove_complete_lines()
+    num_lines_removed = 0
+    y = BOARDHEIGHT - 1 # start y at the bottom of the board
+
+    while y >= 0:
+        if is_complete_line(board, y):
+            # Remove the line and pull boxes down by one line.
+            for pull_down_y in range(y, 0, -1):
+                for x in range(BOARDWIDTH):
+                    board[x][pull_down_y] = board[x][pull_down_y-1]
+            # Set very top line to blank.
+            for x in range(BOARDWIDTH):
+                board[x][0] = BLANK
+            num_lines_removed += 1
+            # Note on the next iteration of the loop, y is the same.
+            # This is so that if the line that was pulled down is also
+            # complete, it will be removed.
+        else:
+            y -= 1 # move on to check next row up
+    return num_lines_removed
+
+class TetrominoEngine(object):
+    # Plays Tetromino one frame at a time without a window or a clock.
+    # Bots play with step():
+    #
+    #     engine = TetrominoEngine()
+    #     state = engine.reset(seed)
+    #     while not done:
+    #         state, lines, done = engine.step(action)
+    #
+    # Each step is one frame (1 / FPS seconds) of the game. The action is
+    # one of ACTIONS, the same as tapping a key in run_game(), and then the
+    # piece falls if it is time to fall. DROP moves the piece all the way
+    # down and sets it on the board straight away, instead of waiting for
+    # the next fall like the game does. lines is the number of lines that
+    # were removed in this step.
+    #
+    # run_game() and the replayer play with run_frame() instead, which
+    # takes the keys pressed and released in a frame and keeps moving the
+    # piece while a key is held down, exactly like the game.
+    #
+    # The state is a dict with these keys. The board and pieces are the
+    # engine's own, so copy them to keep them past the next step:
+    #   'board' - the BitBoard.
+    #   'falling_piece' - the piece dict the player is moving.
+    #   'next_piece' - the piece dict that comes after it.
+    #   'score', 'level', 'fall_freq' - the same as in run_game().
+    #   'pieces' - how many pieces have landed.
+    #   'ticks' - how many frames have been played.
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, seed=None):
+        # Start a new game and return its state. Games with the same seed
+        # get the same pieces.
+        self.rng = random.Random(seed)
+        self.board = get_blank_bitboard()
+        self.score = 0
+        self.level, self.fall_freq = calculate_level_and_fall_freq(self.score)
+        self.pieces = 0
+        self.ticks = 0
+        self.done = False
+        self.falling_piece = get_new_piece(self.rng)
+        self.next_piece = get_new_piece(self.rng)
+        # the times are kept as the tick they happened at
+        self.last_fall_tick = 0
+        self.last_move_down_tick = 0
+        self.last_move_sideways_tick = 0
+        self.moving_down = False # note: there is no moving_up variable
+        self.moving_left = False
+        self.moving_right = False
+        return self.get_state()
+
+    def get_state(self):
+        return {'board': self.board,
+                'falling_piece': self.falling_piece,
+                'next_piece': self.next_piece,
+                'score': self.score,
+                'level': self.level,
+                'fall_freq': self.fall_freq,
+                'pieces': self.pieces,
+                'ticks': self.ticks}
+
+    def step(self, action):
+        # Play one frame with the given action and return the new state,
+        # the number of lines removed and whether the game is over.
+        if self.done:
+            return self.get_state(), 0, True
+        if action == DROP:
+            self.falling_piece['y'] = get_drop_y(self.board, self.falling_piece)
+            lines = self.land_piece()
+        else:
+            self.press(action)
+            self.release(action)
+            lines = self.fall()
+        self.ticks += 1
+        if self.falling_piece == None and not self.done:
+            self.start_next_piece()
+        return self.get_state(), lines, self.done
+
+    def run_frame(self, inputs=()):
+        # Play one frame of run_game(). inputs is a list of (pressed, action)
+        # tuples, in order, for each key pressed (pressed is True) or
+        # released this frame. Returns the number of lines removed.
+        if self.done:
+            return 0
+        if self.falling_piece == None:
+            # No falling piece in play, so start a new piece at the top
+            self.start_next_piece()
+            if self.done:
+                return 0
+
+        for pressed, action in inputs:
+            if pressed:
+                self.press(action)
+            else:
+                self.release(action)
+
+        # handle moving the block because of keys being held down
+        board = self.board
+        piece = self.falling_piece
+        if (self.moving_left or self.moving_right) and self.ticks - self.last_move_sideways_tick > MOVESIDEWAYSFREQ * FPS:
+            if self.moving_left and is_valid_position(board, piece, adj_x=-1):
+                piece['x'] -= 1
+            elif self.moving_right and is_valid_position(board, piece, adj_x=1):
+                piece['x'] += 1
+            self.last_move_sideways_tick = self.ticks
+
+        if self.moving_down and self.ticks - self.last_move_down_tick > MOVEDOWNFREQ * FPS and is_valid_position(board, piece, adj_y=1):
+            piece['y'] += 1
+            self.last_move_down_tick = self.ticks
+
+        lines = self.fall()
+        self.ticks += 1
+        return lines
+
+    def press(self, action):
+        # Do what pressing the key for the action does in the game.
+        board = self.board
+        piece = self.falling_piece
+        # moving the block sideways
+        if action == LEFT and is_valid_position(board, piece, adj_x=-1):
+            piece['x'] -= 1
+            self.moving_left = True
+            self.moving_right = False
+            self.last_move_sideways_tick = self.ticks
+
+        elif action == RIGHT and is_valid_position(board, piece, adj_x=1):
+            piece['x'] += 1
+            self.moving_right = True
+            self.moving_left = False
+            self.last_move_sideways_tick = self.ticks
+
+        # rotating the block (if there is room to rotate)
+        elif action == ROTATE:
+            piece['rotation'] = (piece['rotation'] + 1) % len(SHAPES[piece['shape']])
+            if not is_valid_position(board, piece):
+                piece['rotation'] = (piece['rotation'] - 1) % len(SHAPES[piece['shape']])
+        elif action == ROTATE_BACK:
+            piece['rotation'] = (piece['rotation'] - 1) % len(SHAPES[piece['shape']])
+            if not is_valid_position(board, piece):
+                piece['rotation'] = (piece['rotation'] + 1) % len(SHAPES[piece['shape']])
+
+        # making the block fall faster with the down key
+        elif action == DOWN:
+            self.moving_down = True
+            if is_valid_position(board, piece, adj_y=1):
+                piece['y'] += 1
+            self.last_move_down_tick = self.ticks
+
+        # move the current block all the way down
+        elif action == DROP:
+            self.moving_down = False
+            self.moving_left = False
+            self.moving_right = False
+            piece['y'] = get_drop_y(board, piece)
+
+        # coming back from being paused restarts the timers
+        elif action == PAUSE:
+            self.last_fall_tick = self.ticks
+            self.last_move_down_tick = self.ticks
+            self.last_move_sideways_tick = self.ticks
+
+        elif action not in RECORD_ACTIONS:
+            raise ValueError('unknown action: %r' % (action,))
+
+    def release(self, action):
+        # Do what letting go of the key for the action does in the game.
+        if action == LEFT:
+            self.moving_left = False
+        elif action == RIGHT:
+            self.moving_right = False
+        elif action == DOWN:
+            self.moving_down = False
+
+    def fall(self):
+        # Let the piece fall if it is time to fall, and set it on the board
+        # if it has landed. Returns the number of lines removed.
+        if self.ticks - self.last_fall_tick > self.fall_freq * FPS:
+            # see if the piece has landed
+            if not is_valid_position(self.board, self.falling_piece, adj_y=1):
+                return self.land_piece()
+            # piece did not land, just move the block down
+            self.falling_piece['y'] += 1
+            self.last_fall_tick = self.ticks
+        return 0
+
+    def land_piece(self):
+        # Set the falling piece on the board and remove complete lines.
+        # Returns the number of lines removed.
+        piece = self.falling_piece
+        for x, y in SHAPE_CELLS[piece['shape']][piece['rotation']]:
+            if y + piece['y'] < 0:
+                # landed sticking out of the top of the board, so game over
+                self.done = True
+                return 0
+        add_to_board(self.board, piece)
+        lines = remove_complete_lines(self.board)
+        self.score += lines
+        self.level, self.fall_freq = calculate_level_and_fall_freq(self.score)
+        self.pieces += 1
+        self.falling_piece = None
+        return lines
+
+    def start_next_piece(self):
+        self.falling_piece = self.next_piece
+        self.next_piece = get_new_piece(self.rng)
+        self.last_fall_tick = self.ticks # reset last_fall_tick
+        if not is_valid_position(self.board, self.falling_piece):
+            self.done = True # can't fit a new piece on the board, so game over
+
+
+"""
+A recording is a dictionary with these keys:
+    'seed' - the seed the game's TetrominoEngine was reset with.
+    'inputs' - a list of (tick, pressed, action) tuples for each key pressed or released, in order.
+    'ticks' - how many frames the game lasted.
+    'score' - the score at the end of the game, to check replays against.
+"""
+
+def write_recording(record_file, recording):
+    # Write a recording to the end of an open binary file.
+    record_file.write(RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, recording['seed'], len(recording['inputs']),
+                                         recording['ticks'], recording['score']))
+    codes = []
+    for tick, pressed, action in recording['inputs']:
+        codes.append(RECORD_INPUT.pack(tick, RECORD_ACTIONS.index(action) * 2 + int(pressed)))
+    record_file.write(b''.join(codes))
+
+def read_recordings(filename):
+    # Return a list of every recording in a file.
+    with open(filename, 'rb') as record_file:
+        data = record_file.read()
+    recordings = []
+    offset = 0
+    while offset < len(data):
+        magic, version, seed, num_inputs, ticks, score = RECORD_HEADER.unpack_from(data, offset)
+        if magic != RECORD_MAGIC or version != RECORD_VERSION:
+            raise ValueError('%s is not a version %s Tetromino recording.' % (filename, RECORD_VERSION))
+        offset += RECORD_HEADER.size
+        inputs = []
+        for tick, code in RECORD_INPUT.iter_unpack(data[offset:offset + RECORD_INPUT.size * num_inputs]):
+            inputs.append((tick, bool(code & 1), RECORD_ACTIONS[code >> 1]))
+        offset += RECORD_INPUT.size * num_inputs
+        recordings.append({'seed': seed, 'inputs': inputs, 'ticks': ticks, 'score': score})
+    return recordings
+
+def replay_recording(recording, engine=None):
+    # Play a recording back on a TetrominoEngine, as fast as possible, and
+    # return the engine at the end of the game.
+    if engine == None:
+        engine = TetrominoEngine()
+    engine.reset(recording['seed'])
+    inputs = recording['inputs']
+    i = 0
+    while not engine.done and engine.ticks < recording['ticks']:
+        frame_inputs = []
+        while i < len(inputs) and inputs[i][0] == engine.ticks:
+            frame_inputs.append(inputs[i][1:])
+            i += 1
+        engine.run_frame(frame_inputs)
+    return engine
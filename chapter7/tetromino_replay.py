@@ -0,0 +1,44 @@
+# Tetromino Replayer
+# Plays back games recorded with "python tetromino.py [record file]"
+# without a window, as fast as possible.
+# Creative Commons BY-NC-SA 3.0 US
+
+import sys, time, argparse
+
+from tetromino_engine import *
+
+def main():
+    parser = argparse.ArgumentParser(description='Play back recorded Tetromino games and check that they end the same way.')
+    parser.add_argument('filename', help='the record file to play back')
+    parser.add_argument('--repeat', type=int, default=1, help='play each game this many times, for timing')
+    args = parser.parse_args()
+
+    recordings = read_recordings(args.filename)
+    engine = TetrominoEngine()
+    num_mismatched = 0
+    total_ticks = 0
+    total_time = 0.0
+    for game_num in range(len(recordings)):
+        recording = recordings[game_num]
+        start_time = time.time()
+        for i in range(args.repeat):
+            replay_recording(recording, engine)
+        replay_time = (time.time() - start_time) / args.repeat
+        total_ticks += engine.ticks
+        total_time += replay_time
+
+        status = 'ok'
+        if engine.ticks != recording['ticks'] or engine.score != recording['score']:
+            status = 'MISMATCH (recorded %s ticks, score %s)' % (recording['ticks'], recording['score'])
+            num_mismatched += 1
+        print('Game %s: seed %s, %s inputs, %s ticks, score %s, %.1f ms - %s' % (game_num + 1, recording['seed'], len(recording['inputs']),
+                                                                                   engine.ticks, engine.score, replay_time * 1000, status))
+
+    if total_time > 0:
+        print('Replayed %s ticks in %.3f seconds (%d ticks per second, %.0fx real time).' % (total_ticks, total_time, total_ticks / total_time,
+                                                                                           total_ticks / total_time / FPS))
+    if num_mismatched:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+# Tetromino Tuner
+# Evolves the feature weights of the Tetromino AI with a genetic algorithm,
+# playing the games for each generation on a process pool.
+# Creative Commons BY-NC-SA 3.0 US
+
+import os, time, json, math, random, argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import tetromino_ai
+
+"""
+Usage: python tetromino_tuner.py [--generations N] [--population N] [--games N]
+                                 [--max-pieces N] [--workers N] [--checkpoint FILE] [--restart]
+
+Each candidate is a set of weights for tetromino_ai.evaluate(). Its
+fitness is the average number of lines it clears in --games seeded games
+of at most --max-pieces pieces. Every candidate in a generation plays the
+same seeds so they are compared fairly, and the seeds change each
+generation so the weights don't just learn a few games.
+
+Each generation, the best candidates are bred: two parents are picked by
+tournament, their weights are averaged (weighted by fitness), sometimes
+mutated, and scaled to length 1 (only the direction of the weights
+matters to the AI). The children replace the worst REPLACE_FRACTION of
+the population.
+
+After every generation the population is saved to the checkpoint file,
+and running the tuner again carries on from there.
+
+The checkpoint data structure (saved as JSON) is a dictionary with these keys:
+    'generation' - the number of generations done.
+    'population' - a list of candidates, best first, each a dict with 'weights' (a dict like tetromino_ai.DEFAULT_WEIGHTS) and 'fitness' (from the last generation, None for the new children).
+    'random_state' - the state of the tuner's random.Random, so a resumed run breeds the same children.
+    'settings' - the --population size, and the --games and --max-pieces the fitness values were measured with.
+"""
+
+FEATURES = tuple(sorted(tetromino_ai.DEFAULT_WEIGHTS))
+POPULATION = 30
+GAMES = 10 # games played by each candidate per generation
+MAX_PIECES = 300 # pieces per game, so that good candidates don't play forever
+GENERATIONS = 20
+TOURNAMENT_SIZE = 5 # candidates picked at random to choose each parent from
+REPLACE_FRACTION = 0.3 # the part of the population replaced by children each generation
+MUTATION_CHANCE = 0.2
+MUTATION_SIZE = 0.2
+CHECKPOINT_FILENAME = 'tetrominoTuner.ckpt'
+
+def normalize(weights):
+    # Return the weights scaled so that, as a vector, their length is 1.
+    length = math.sqrt(sum(weights[feature] ** 2 for feature in FEATURES))
+    if length == 0:
+        return dict(weights)
+    return dict((feature, weights[feature] / length) for feature in FEATURES)
+
+def make_random_weights(rng):
+    return normalize(dict((feature, rng.uniform(-1, 1)) for feature in FEATURES))
+
+def make_population(size, rng):
+    # The default weights are in the first population, so the tuner can
+    # only end up with something at least as good as them.
+    population = [{'weights': normalize(tetromino_ai.DEFAULT_WEIGHTS), 'fitness': None}]
+    while len(population) < size:
+        population.append({'weights': make_random_weights(rng), 'fitness': None})
+    return population
+
+def pick_parent(population, rng):
+    # Return the fittest of TOURNAMENT_SIZE random candidates.
+    contenders = rng.sample(population, min(TOURNAMENT_SIZE, len(population)))
+    return max(contenders, key=lambda candidate: candidate['fitness'])
+
+def make_child(population, rng):
+    parent1 = pick_parent(population, rng)
+    parent2 = pick_parent(population, rng)
+    fitness1 = max(parent1['fitness'], 0)
+    fitness2 = max(parent2['fitness'], 0)
+    if fitness1 + fitness2 == 0:
+        fitness1 = fitness2 = 1 # neither cleared a line, so average them evenly
+    weights = {}
+    for feature in FEATURES:
+        weights[feature] = (parent1['weights'][feature] * fitness1 + parent2['weights'][feature] * fitness2) / (fitness1 + fitness2)
+    if rng.random() < MUTATION_CHANCE:
+        weights[rng.choice(FEATURES)] += rng.uniform(-MUTATION_SIZE, MUTATION_SIZE)
+    return {'weights': normalize(weights), 'fitness': None}
+
+def play_candidate_game(weights, seed, max_pieces):
+    # Runs in a worker process. Returns the lines cleared in one game.
+    return tetromino_ai.play_game(seed, weights, max_pieces)['lines']
+
+def evaluate_population(population, generation, games, max_pieces, executor):
+    # Play the generation's games for every candidate, all at once across
+    # the process pool, and set their fitness. The survivors of the last
+    # generation play too, so everyone is measured on the same games.
+    seeds = [generation * games + i for i in range(games)]
+    jobs = []
+    for candidate in population:
+        for seed in seeds:
+            jobs.append((candidate['weights'], seed))
+    lines = list(executor.map(play_candidate_game, [job[0] for job in jobs], [job[1] for job in jobs],
+                              [max_pieces] * len(jobs), chunksize=max(1, len(jobs) // 64)))
+    for i in range(len(population)):
+        population[i]['fitness'] = sum(lines[i * games:(i + 1) * games]) / games
+
+def save_checkpoint(filename, checkpoint):
+    # Write to a temporary file first, so that stopping the tuner while
+    # it saves can't leave a broken checkpoint.
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, indent=2)
+    os.replace(temp_filename, filename)
+
+def load_checkpoint(filename):
+    with open(filename) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    # JSON turns the tuples of the random state into lists
+    version, internal_state, gauss_next = checkpoint['random_state']
+    checkpoint['random_state'] = (version, tuple(internal_state), gauss_next)
+    return checkpoint
+
+def format_weights(weights):
+    return ', '.join('%s %.4f' % (feature, weights[feature]) for feature in FEATURES)
+
+def main():
+    parser = argparse.ArgumentParser(description='Evolve the weights of the Tetromino AI.')
+    parser.add_argument('--generations', type=int, default=GENERATIONS, help='stop after this many generations in total')
+    parser.add_argument('--population', type=int, default=POPULATION, help='candidates per generation')
+    parser.add_argument('--games', type=int, default=GAMES, help='games played by each candidate per generation')
+    parser.add_argument('--max-pieces', type=int, default=MAX_PIECES, help='pieces per game')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILENAME, help='file to save the population to and resume from')
+    parser.add_argument('--restart', action='store_true', help='start a new population even if the checkpoint file exists')
+    parser.add_argument('--seed', type=int, default=0, help='seed for breeding a new population')
+    args = parser.parse_args()
+
+    settings = {'population': args.population, 'games': args.games, 'max_pieces': args.max_pieces}
+    rng = random.Random(args.seed)
+    if os.path.exists(args.checkpoint) and not args.restart:
+        checkpoint = load_checkpoint(args.checkpoint)
+        if checkpoint['settings'] != settings:
+            parser.error('%s was made with %s. Use the same settings, or --restart.' % (args.checkpoint, checkpoint['settings']))
+        rng.setstate(checkpoint['random_state'])
+        print('Resuming from generation %s in %s.' % (checkpoint['generation'], args.checkpoint))
+    else:
+        checkpoint = {'generation': 0,
+                      'population': make_population(args.population, rng),
+                      'settings': settings}
+
+    population = checkpoint['population']
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        while checkpoint['generation'] < args.generations:
+            start_time = time.time()
+            evaluate_population(population, checkpoint['generation'], args.games, args.max_pieces, executor)
+            population.sort(key=lambda candidate: candidate['fitness'], reverse=True)
+            best = population[0]
+            average = sum(candidate['fitness'] for candidate in population) / len(population)
+            print('Generation %s: best %.1f lines, average %.1f lines, %.1f seconds' % (checkpoint['generation'] + 1, best['fitness'],
+                                                                                        average, time.time() - start_time))
+            print('    best weights: %s' % format_weights(best['weights']))
+
+            # breed the children that replace the worst candidates
+            num_children = max(1, int(len(population) * REPLACE_FRACTION))
+            children = [make_child(population, rng) for i in range(num_children)]
+            population[-num_children:] = children
+
+            checkpoint['generation'] += 1
+            checkpoint['random_state'] = rng.getstate()
+            save_checkpoint(args.checkpoint, checkpoint)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# Entity Store
+# Keeps the numbers of many game objects in NumPy arrays, an array for
+# each key, so a whole kind of object can be updated at once.
+# Creative Commons BY-NC-SA 3.0 US
+
+import numpy
+
+"""
+An EntityStore is used like a dictionary of arrays, with an entry in each
+array for every object in the store:
+
+    squirrels = EntityStore([('x', numpy.int64), ('movex', numpy.int64)])
+    squirrels.add({'x': 10, 'movex': 3})
+    squirrels['x'] += squirrels['movex'] # moves every squirrel
+
+store[key] is a view of the live part of the key's array, so changing it
+changes the store. It is only good until the next add() or remove().
+
+Every object also gets a 'num', which counts up as objects are added.
+Removing objects moves the last objects into the gaps they leave instead
+of shifting everything down, so the order of the arrays changes, and
+in_order() puts a set of indexes back in the order the objects were added.
+
+The arrays have room for more objects than are in the store, and double
+in size when they run out, so adding and removing objects doesn't make
+new arrays every frame.
+"""
+
+START_CAPACITY = 64
+
+class EntityStore(object):
+
+    def __init__(self, columns, capacity=START_CAPACITY):
+        # columns is a list of (key, NumPy dtype) for the objects' values.
+        self.keys = [key for key, dtype in columns]
+        self.arrays = {}
+        for key, dtype in list(columns) + [('num', numpy.int64)]:
+            self.arrays[key] = numpy.zeros(capacity, dtype=dtype)
+        self.count = 0
+        self.num_made = 0
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, key):
+        return self.arrays[key][:self.count]
+
+    def __setitem__(self, key, values):
+        # (also what makes store[key] += values work)
+        self.arrays[key][:self.count] = values
+
+    def add(self, obj):
+        # Add an object from a dictionary with a value for each key, and
+        # return its index.
+        if self.count == len(self.arrays['num']):
+            self.grow()
+        i = self.count
+        for key in self.keys:
+            self.arrays[key][i] = obj[key]
+        self.arrays['num'][i] = self.num_made
+        self.num_made += 1
+        self.count += 1
+        return i
+
+    def grow(self):
+        # Double the room in the arrays.
+        for key, array in self.arrays.items():
+            bigger = numpy.zeros(len(array) * 2, dtype=array.dtype)
+            bigger[:self.count] = array[:self.count]
+            self.arrays[key] = bigger
+
+    def remove(self, indexes):
+        # Remove the objects at the given indexes. The objects at the end
+        # of the arrays that are being kept are moved into the gaps below
+        # the new count, so there are as many of them as there are gaps.
+        indexes = numpy.unique(indexes)
+        if not len(indexes):
+            return
+        new_count = self.count - len(indexes)
+        gaps = indexes[indexes < new_count]
+        moving = numpy.setdiff1d(numpy.arange(new_count, self.count), indexes, assume_unique=True)
+        for array in self.arrays.values():
+            array[gaps] = array[moving]
+        self.count = new_count
+
+    def in_order(self, indexes):
+        # Return the indexes sorted into the order their objects were added.
+        indexes = numpy.asarray(indexes)
+        return indexes[numpy.argsort(self.arrays['num'][indexes])]
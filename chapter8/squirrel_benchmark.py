@@ -0,0 +1,233 @@
+# Squirrel Eat Squirrel Benchmarks
+# Times drawing and moving lots of squirrels without a window, and
+# compares the results from two checkouts.
+# Creative Commons BY-NC-SA 3.0 US
+
+import os, time, json, random, platform, argparse
+
+# run without a window or sound (this has to be set before pygame starts)
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+from pygame.locals import *
+import squirrel_eat_squirrel
+
+"""
+Usage:
+    python squirrel_benchmark.py [--output results.json] [--repeat N] [--seed N] [--squirrels N N ...]
+    python squirrel_benchmark.py --compare old.json new.json
+
+Every benchmark is set up from a fixed seed, so two checkouts time the
+same work, and runs once for each number of squirrels in --squirrels.
+Each one runs its calls --repeat times and keeps the fastest run. The
+benchmarks only use functions that squirrel_eat_squirrel.py has had
+since the squirrels were put in an EntityStore, and skip the ones a
+checkout doesn't have.
+
+The results data structure (also what is saved as JSON) is a dictionary with these keys:
+    'python', 'pygame', 'machine' - what the benchmarks ran on.
+    'seed', 'repeat' - the options used.
+    'results' - a dict mapping each benchmark name to a dict with 'calls' (calls per run) and 'us_per_call' (microseconds per call in the fastest run).
+"""
+
+REPEAT = 5
+SEED = 2024
+SQUIRREL_COUNTS = (30, 1000, 10000)
+# Whole frames are only timed up to this many squirrels. With more, the
+# player runs into so many that it quickly grows far bigger than the screen.
+MAX_FRAME_SQUIRRELS = 1000
+CHANGE_THRESHOLD = 0.05 # changes smaller than 5% are reported as the same
+
+SCRIPTED_KEYS = (K_LEFT, K_RIGHT, K_UP, K_DOWN)
+
+def make_squirrels(num_squirrels):
+    # Return an EntityStore of squirrels spread over the screen (and a
+    # little past its edges) at random points in their bounces.
+    game = squirrel_eat_squirrel
+    squirrels = game.EntityStore(game.SQUIRRELCOLUMNS)
+    for i in range(num_squirrels):
+        sq = game.make_new_squirrel(0, 0)
+        sq['x'] = random.randint(-sq['width'], game.WINWIDTH)
+        sq['y'] = random.randint(-sq['height'], game.WINHEIGHT + game.SQUIRRELMAXBOUNCEHEIGHT)
+        sq['bounce'] = random.randint(0, sq['bouncerate'])
+        squirrels.add(sq)
+    return squirrels
+
+def time_calls(run, calls, repeat):
+    # Call run() repeat times and return the fastest time divided by
+    # calls, in microseconds.
+    best = None
+    for i in range(repeat):
+        start_time = time.perf_counter()
+        run()
+        run_time = time.perf_counter() - start_time
+        if best == None or run_time < best:
+            best = run_time
+    return best * 1000000 / calls
+
+def bench_get_bounce_amounts(squirrels, repeat):
+    calls = 200
+    get_bounce_amounts = squirrel_eat_squirrel.get_bounce_amounts
+
+    def run():
+        for i in range(calls):
+            get_bounce_amounts(squirrels)
+    return time_calls(run, calls, repeat), calls
+
+def bench_get_bounce_amount(squirrels, repeat):
+    # Time the way the bounces were found before the bounce table, with
+    # get_bounce_amount() (math.sin) called for each squirrel, so every
+    # run shows what get_bounce_amounts() is compared with.
+    calls = 200
+    get_bounce_amount = squirrel_eat_squirrel.get_bounce_amount
+    bounces = list(zip(squirrels['bounce'].tolist(), squirrels['bouncerate'].tolist(), squirrels['bounceheight'].tolist()))
+
+    def run():
+        for i in range(calls):
+            [get_bounce_amount(current_bounce, bounce_rate, bounce_height) for current_bounce, bounce_rate, bounce_height in bounces]
+    return time_calls(run, calls, repeat), calls
+
+def bench_draw_squirrels(squirrels, repeat):
+    calls = 10
+    draw_squirrels = squirrel_eat_squirrel.draw_squirrels
+
+    def run():
+        for i in range(calls):
+            draw_squirrels(squirrels, 0, 0)
+    return time_calls(run, calls, repeat), calls
+
+def bench_move_squirrels(squirrels, repeat):
+    calls = 200
+    move_squirrels = squirrel_eat_squirrel.move_squirrels
+    rng = squirrel_eat_squirrel.numpy.random.default_rng(random.getrandbits(64))
+
+    def run():
+        for i in range(calls):
+            move_squirrels(squirrels, rng)
+    return time_calls(run, calls, repeat), calls
+
+class FramesDone(Exception):
+    pass
+
+class ScriptedClock(object):
+    # Stands in for FPSCLOCK in run_game(). Instead of waiting, it posts the
+    # key presses for the next frame, and stops the game after num_frames.
+
+    def __init__(self, rng, num_frames):
+        self.rng = rng
+        self.num_frames = num_frames
+        self.frame = 0
+        self.held_key = None
+
+    def tick(self, framerate=0):
+        self.frame += 1
+        if self.frame >= self.num_frames:
+            raise FramesDone()
+        if self.held_key != None and self.rng.random() < 0.1:
+            pygame.event.post(pygame.event.Event(KEYUP, key=self.held_key, mod=0))
+            self.held_key = None
+        elif self.held_key == None and self.rng.random() < 0.2:
+            self.held_key = self.rng.choice(SCRIPTED_KEYS)
+            pygame.event.post(pygame.event.Event(KEYDOWN, key=self.held_key, mod=0))
+        return 0
+
+def bench_run_game_frame(num_squirrels, rng, repeat):
+    # Time whole frames of run_game(), with seeded key presses standing in
+    # for a player, and NUMSQUIRRELS squirrels in the active area.
+    num_frames = 100
+    old_num_squirrels = squirrel_eat_squirrel.NUMSQUIRRELS
+    squirrel_eat_squirrel.NUMSQUIRRELS = num_squirrels
+    random_state = random.getstate()
+
+    def run():
+        random.seed(rng.random()) # the squirrels and grass in run_game()
+        squirrel_eat_squirrel.FPSCLOCK = ScriptedClock(random.Random(rng.random()), num_frames)
+        pygame.event.clear()
+        try:
+            while True:
+                squirrel_eat_squirrel.run_game()
+        except FramesDone:
+            pass
+    us_per_call = time_calls(run, num_frames, repeat)
+    random.setstate(random_state)
+    squirrel_eat_squirrel.NUMSQUIRRELS = old_num_squirrels
+    return us_per_call, num_frames
+
+def run_benchmarks(seed, repeat, squirrel_counts):
+    game = squirrel_eat_squirrel
+    pygame.init()
+    os.chdir(os.path.dirname(os.path.abspath(game.__file__))) # for the image files
+    game.DISPLAYSURF = pygame.display.set_mode((game.WINWIDTH, game.WINHEIGHT))
+    game.BASICFONT = pygame.font.Font('freesansbold.ttf', 32)
+    game.L_SQUIR_IMG = pygame.image.load('squirrel.png')
+    game.R_SQUIR_IMG = pygame.transform.flip(game.L_SQUIR_IMG, True, False)
+    game.GRASSIMAGES = [pygame.image.load('grass%s.png' % i) for i in range(1, 5)]
+
+    results = {}
+    for num_squirrels in squirrel_counts:
+        for name, bench in (('get_bounce_amount', bench_get_bounce_amount),
+                            ('get_bounce_amounts', bench_get_bounce_amounts),
+                            ('draw_squirrels', bench_draw_squirrels),
+                            ('move_squirrels', bench_move_squirrels)):
+            if not hasattr(game, name):
+                continue
+            random.seed(seed)
+            us_per_call, calls = bench(make_squirrels(num_squirrels), repeat)
+            results['%s[%s]' % (name, num_squirrels)] = {'us_per_call': us_per_call, 'calls': calls}
+        if num_squirrels > MAX_FRAME_SQUIRRELS:
+            continue
+        us_per_call, calls = bench_run_game_frame(num_squirrels, random.Random(seed), repeat)
+        results['run_game frame[%s]' % num_squirrels] = {'us_per_call': us_per_call, 'calls': calls}
+
+    return {'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'machine': platform.machine(),
+            'seed': seed,
+            'repeat': repeat,
+            'results': results}
+
+def print_results(results):
+    for name in sorted(results['results']):
+        print('%-32s %10.2f us' % (name, results['results'][name]['us_per_call']))
+
+def compare_results(old, new):
+    # Print each benchmark in both sets of results and how it changed.
+    print('%-32s %10s %10s %8s' % ('benchmark', 'old us', 'new us', 'change'))
+    for name in sorted(set(old['results']) | set(new['results'])):
+        if name not in old['results'] or name not in new['results']:
+            print('%-32s (only in %s)' % (name, 'new' if name in new['results'] else 'old'))
+            continue
+        old_us = old['results'][name]['us_per_call']
+        new_us = new['results'][name]['us_per_call']
+        change = new_us / old_us - 1
+        if change < -CHANGE_THRESHOLD:
+            verdict = 'faster'
+        elif change > CHANGE_THRESHOLD:
+            verdict = 'SLOWER'
+        else:
+            verdict = 'same'
+        print('%-32s %10.2f %10.2f %+7.1f%% %s' % (name, old_us, new_us, change * 100, verdict))
+
+def main():
+    parser = argparse.ArgumentParser(description='Time drawing and moving lots of squirrels.')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='runs of each benchmark, the fastest is kept')
+    parser.add_argument('--seed', type=int, default=SEED, help='seed for the squirrels and key presses')
+    parser.add_argument('--squirrels', type=int, nargs='+', default=SQUIRREL_COUNTS, help='numbers of squirrels to run the benchmarks with')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two saved JSON results instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as old_file, open(args.compare[1]) as new_file:
+            compare_results(json.load(old_file), json.load(new_file))
+        return
+
+    results = run_benchmarks(args.seed, args.repeat, args.squirrels)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
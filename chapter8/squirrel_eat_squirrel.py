@@ -3,9 +3,11 @@
 # http://inventwithpython.com/pygame
 # Creative Commons BY-NC-SA 3.0 US
 
-import random, sys, time, math, pygame
+import random, sys, time, math, collections, numpy, pygame
 from pygame.locals import *
 
+from entity_store import EntityStore
+
 FPS = 30
 WINWIDTH = 640
 WINHEIGHT = 480
@@ -25,24 +27,29 @@ WINSIZE = 300 # how big the player needs to be to win
 INVULNTIME = 2 # how long the player is invulnerable after being hit in seconds
 GAMEOVERTIME = 4 # how long the "game over" text stays on the screen in seconds
 MAXHEALTH = 3 # how much health the player starts with
-NUMGRASS = 80 # number of grass objects in the active area
+GRASSPERCHUNK = 9 # number of grass objects in each window-sized chunk of the background
+GRASSCHUNKKEEP = 1 # how many chunks past the screen are kept for when the player comes back
 NUMSQUIRRELS = 30 # number of squirrels in the active area
 SQUIRRELMINSPEED = 3 # slowest squirrel speed
 SQUIRRELMAXSPEED = 7 # fastest squirrel speed
 DIRCHANGEFREQ = 2 # % chance of direction change per frame
+SQUIRRELMAXBOUNCERATE = 18 # slowest any squirrel bounces
+SQUIRRELMAXBOUNCEHEIGHT = 50 # highest any squirrel bounces
+SQUIRRELIMAGECACHESIZE = 1024 # most scaled squirrel images kept for reuse
+SQUIRRELIMAGECACHEMAXAREA = 128 * 128 # bigger images (only the player gets this big) aren't kept
 
 LEFT = 'left'
 RIGHT = 'right'
 
 """
-This program has three data structures to represent the player, enemy squirrels, and grass background objects. The data structures are dictionaries with the following keys:
+This program has three data structures to represent the player, enemy squirrels, and grass background objects. The player and the grass objects are dictionaries. The enemy squirrels are kept in an EntityStore (see entity_store.py), which has a NumPy array for each key with an entry for every squirrel, so they can all be moved and checked at once. make_new_squirrel() returns a dictionary of one squirrel's values to add to the store. The keys are:
 
 Keys used by all three data structures:
     'x' - the left edge coordinate of the object in the game world (not a pixel coordinate on the screen)
     'y' - the top edge coordinate of the object in the game world (not a pixel coordinate on the screen)
-    'rect' - the pygame.Rect object representing where on the screen the object is located.
 
 Player data structure keys:
+    'rect' - the pygame.Rect object representing where on the screen the player is located.
     'surface' - the pygame.Surface object that stores the image of the squirrel which will be drawn to the screen.
     'facing' - either set to LEFT or RIGHT, stores which direction the player is facing.
     'size' - the width and height of the player in pixels. (The width & height are always the same.)
@@ -50,20 +57,50 @@ Player data structure keys:
     'health' - an integer showing how many more times the player can be hit by a larger squirrel before dying.
 
 Enemy Squirrel data structure keys:
-    'surface' - the pygame.Surface object that stores the image of the squirrel which will be drawn to the screen.
-    'movex' - how many pixels per frame the squirrel moves horizontally. A negative integer is moving to the left, a positive to the right.
+    'movex' - how many pixels per frame the squirrel moves horizontally. A negative integer is moving to the left, a positive to the right. The squirrel's image faces the way it moves.
     'movey' - how many pixels per frame the squirrel moves vertically. A negative integer is moving up, a positive moving down.
     'width' - the width of the squirrel's image, in pixels
     'height' - the height of the squirrel's image, in pixels
     'bounce' - represents at what point in a bounce the player is in. 0 means standing (no bounce), up to BOUNCERATE (the completion of the bounce)
     'bouncerate' - how quickly the squirrel bounces. A lower number means a quicker bounce.
     'bounceheight' - how high (in pixels) the squirrel bounces
+    'surface' - the pygame.Surface object that stores the image of the squirrel, from the squirrel image cache. It is only looked up when the squirrel is made or turns around.
 
 Grass data structure keys:
     'grass_image' - an integer that refers to the index of the pygame.Surface object in GRASSIMAGES used for this grass object
-
+    'width' - the width of the grass image, in pixels
+    'height' - the height of the grass image, in pixels
+
+The grass is drawn as part of the background, which is split into
+chunks the size of the window. The chunk at (chunkx, chunky) covers the
+game world from chunkx * WINWIDTH, chunky * WINHEIGHT. Each game has a
+grass seed, and a chunk's grass objects are always made the same from
+the seed and the chunk's coordinates, so the grass is still there when
+the player comes back. Each chunk is drawn once onto its own Surface
+and kept in a dictionary of grass chunks that maps (chunkx, chunky) to
+the Surface, so at most four chunk Surfaces are drawn to the screen each
+frame. Chunks more than GRASSCHUNKKEEP chunks past the screen are thrown
+out, and are made again if they come back into view.
+
+The squirrel image cache is an OrderedDict that maps a (facing, width,
+height) tuple to a scaled copy of L_SQUIR_IMG or R_SQUIR_IMG, least
+recently used first. Squirrels of the same size share the same Surface
+(nothing draws onto them), so a size only has to be scaled once until
+the cache gets full and it is thrown out. Images bigger than
+SQUIRRELIMAGECACHEMAXAREA are made every time instead of being kept.
 """
 
+# the squirrel image cache (see above), and how often it had the image
+SQUIRRELIMAGECACHE = collections.OrderedDict()
+SQUIRRELIMAGECACHESTATS = {'hits': 0, 'misses': 0}
+
+# the keys and NumPy types of the enemy squirrel store
+SQUIRRELCOLUMNS = [('x', numpy.int64), ('y', numpy.int64),
+                   ('movex', numpy.int64), ('movey', numpy.int64),
+                   ('width', numpy.int64), ('height', numpy.int64),
+                   ('bounce', numpy.int64), ('bouncerate', numpy.int64), ('bounceheight', numpy.int64),
+                   ('surface', object)]
+
 def main():
     global FPSCLOCK, DISPLAYSURF, BASICFONT, L_SQUIR_IMG, R_SQUIR_IMG, GRASSIMAGES
 
@@ -109,10 +146,13 @@ def run_game():
     camerax = 0
     cameray = 0
 
-    grass_objs = [] # stores all the grass objects in the game
-    squirrel_objs = [] # stores all the non-player squirrel objects
+    grass_seed = random.getrandbits(32) # the grass is the same wherever the player goes back to
+    grass_chunks = {} # stores the background chunks that have been drawn (see above)
+    squirrel_objs = EntityStore(SQUIRRELCOLUMNS) # stores all the non-player squirrel objects
+    # the squirrels' random direction changes are made all at once by NumPy
+    squirrel_random = numpy.random.default_rng(random.getrandbits(64))
     # stores the player object:
-    player_obj = {'surface': pygame.transform.scale(L_SQUIR_IMG, (STARTSIZE, STARTSIZE)),
+    player_obj = {'surface': get_squirrel_image(LEFT, STARTSIZE, STARTSIZE),
                   'facing': LEFT,
                   'size': STARTSIZE,
                   'x': HALF_WINWIDTH,
@@ -125,51 +165,20 @@ def run_game():
     move_up = False
     move_down = False
 
-    # start off with some random grass images on the screen
-    for i in range(10):
-        grass_objs.append(make_new_grass(camerax, cameray))
-        grass_objs[i]['x'] = random.randint(0, WINWIDTH)
-        grass_objs[i]['y'] = random.randint(0, WINHEIGHT)
-
     while True: # main game loop
         # Check if we should turn off invulnerability
         if invulnerable_mode and time.time() - invulnerable_start_time > INVULNTIME:
             invulnerable_mode = False
 
         # move all the squirrels
-        for s_obj in squirrel_objs:
-            # move the squirrel, and adjust for their bounce
-            s_obj['x'] += s_obj['movex']
-            s_obj['y'] += s_obj['movey']
-            s_obj['bounce'] += 1
-            if s_obj['bounce'] > s_obj['bouncerate']:
-                s_obj['bounce'] = 0 # reset bounce amount # ????
-
-            # random change they change direction
-            if random.randint(0, 99) < DIRCHANGEFREQ:
-                s_obj['movex'] = get_random_velocity()
-                s_obj['movey'] = get_random_velocity()
-                if s_obj['movex'] > 0: # faces right
-                    s_obj['surface'] = pygame.transform.scale(R_SQUIR_IMG,
-                        (s_obj['width'], s_obj['height']))
-                else:
-                    s_obj['surface'] = pygame.transform.scale(L_SQUIR_IMG,
-                        (s_obj['width'], s_obj['height']))
+        move_squirrels(squirrel_objs, squirrel_random)
 
         # go through all the objects and see if any need to be deleted.
-        # The iteration is done in a reverse order so that index error doesn't occur.
-        for i in range(len(grass_objs) - 1, -1, -1):
-            if is_outside_active_area(camerax, cameray, grass_objs[i]):
-                del grass_objs[i]
-        for i in range(len(squirrel_objs) - 1, -1, -1):
-            if is_outside_active_area(camerax, cameray, squirrel_objs[i]):
-                del squirrel_objs[i]
-                    
-        # add more grass & squirrels if we don't have enough.
-        while len(grass_objs) < NUMGRASS:
-            grass_objs.append(make_new_grass(camerax, cameray))
+        squirrel_objs.remove(numpy.flatnonzero(get_outside_active_area(camerax, cameray, squirrel_objs)))
+
+        # add more squirrels if we don't have enough.
         while len(squirrel_objs) < NUMSQUIRRELS:
-            squirrel_objs.append(make_new_squirrel(camerax, cameray))
+            squirrel_objs.add(make_new_squirrel(camerax, cameray))
 
         # adjust camerax and cameray if beyond the "camera slack"
         player_centerx = player_obj['x'] + int(player_obj['size'] / 2)
@@ -183,33 +192,17 @@ def run_game():
         elif player_centery - (cameray + HALF_WINHEIGHT) > CAMERASLACK:
             cameray = player_centery - CAMERASLACK - HALF_WINHEIGHT
 
-        # draw the green background
-        DISPLAYSURF.fill(GRASSCOLOR)
-        
-        # draw all the grass objects on the screen
-        for g_obj in grass_objs:
-            g_rect = pygame.Rect( (g_obj['x'] - camerax,
-                g_obj['y'] - cameray,
-                g_obj['width'],
-                g_obj['height']) )
-            DISPLAYSURF.blit(GRASSIMAGES[g_obj['grass_image']], g_rect)
-
-        # draw the other squirrels
-        for s_obj in squirrel_objs:
-            s_obj['rect'] = pygame.Rect( (s_obj['x'] - camerax,
-                    s_obj['y'] - cameray - get_bounce_amount(s_obj['bounce'],
-                        s_obj['bouncerate'], s_obj['bounceheight']),
-                        s_obj['width'],
-                        s_obj['height']) )
-            DISPLAYSURF.blit(s_obj['surface'], s_obj['rect'])
+        # draw the green background and the grass
+        draw_grass_chunks(grass_chunks, grass_seed, camerax, cameray)
+
+        # draw the other squirrels that are on the screen
+        squirrel_tops = draw_squirrels(squirrel_objs, camerax, cameray)
 
         # draw the player squirrel
         flash_is_on = round(time.time(), 1) * 10 % 2 == 1
         if not game_over_mode and not (invulnerable_mode and flash_is_on):
             player_obj['rect'] = pygame.Rect( (player_obj['x'] - camerax,
-                player_obj['y'] - cameray - get_bounce_amount(player_obj['bounce'],
-                    BOUNCERATE,
-                    BOUNCEHEIGHT),
+                player_obj['y'] - cameray - int(BOUNCETABLE[BOUNCERATE, BOUNCEHEIGHT, player_obj['bounce']]),
                 player_obj['size'],
                 player_obj['size']) ) # ????
             DISPLAYSURF.blit(player_obj['surface'], player_obj['rect'])
@@ -232,15 +225,13 @@ def run_game():
                     move_right = False
                     move_left = True
                     if player_obj['facing'] == RIGHT: # change player image
-                        player_obj['surface'] = pygame.transform.scale(L_SQUIR_IMG,
-                            (player_obj['size'], player_obj['size']))
+                        player_obj['surface'] = get_squirrel_image(LEFT, player_obj['size'], player_obj['size'])
                     player_obj['facing'] = LEFT
                 elif event.key in (K_RIGHT, K_d):
                     move_left = False
                     move_right = True
                     if player_obj['facing'] == LEFT: # change player image
-                        player_obj['surface'] = pygame.transform.scale(R_SQUIR_IMG,
-                            (player_obj['size'], player_obj['size']))
+                        player_obj['surface'] = get_squirrel_image(RIGHT, player_obj['size'], player_obj['size'])
                     player_obj['facing'] = RIGHT
                 elif win_mode and event.key == K_r:
                     return # if you won and press r, restart the game
@@ -273,33 +264,35 @@ def run_game():
             if player_obj['bounce'] > BOUNCERATE:
                 player_obj['bounce'] = 0 # reset bounce amount # ????
 
-            # check if the player has collided with any squirrels
-            for i in range(len(squirrel_objs)-1, -1, -1):
-                sq_obj = squirrel_objs[i]
-                if 'rect' in sq_obj and player_obj['rect'].colliderect(sq_obj['rect']):
-                    # a player/squirrel collision has occurred
-                    if sq_obj['width'] * sq_obj['height'] <= player_obj['size']**2:
-                        # player is larger and eats the squirrel
-                        player_obj['size'] += int( (sq_obj['width'] * sq_obj['height'])**0.2 ) + 1
-                        del squirrel_objs[i]
-
-                        if player_obj['facing'] == LEFT:
-                            player_obj['surface'] = pygame.transform.scale(L_SQUIR_IMG,
-                                (player_obj['size'], player_obj['size']))
-                        if player_obj['facing'] == RIGHT:
-                            player_obj['surface'] = pygame.transform.scale(R_SQUIR_IMG,
-                                (player_obj['size'], player_obj['size']))
-                        if player_obj['size'] > WINSIZE:
-                            win_mode = True # turn on "win mode"
-
-                    elif not invulnerable_mode:
-                        # player is smaller and takes damage
-                        invulnerable_mode = True
-                        invulnerable_start_time = time.time()
-                        player_obj['health'] -= 1
-                        if player_obj['health'] == 0:
-                            game_over_mode = True # turn on "game over mode"
-                            game_over_start_time = time.time()
+            # check if the player has collided with any squirrels, newest
+            # squirrels first
+            # (squirrel_tops is from drawing them, they haven't moved since)
+            player_rect = player_obj['rect']
+            colliding = get_overlapping(squirrel_objs, squirrel_tops, player_rect.left + camerax, player_rect.top + cameray,
+                                        player_rect.width, player_rect.height)
+            eaten = []
+            for i in reversed(squirrel_objs.in_order(numpy.flatnonzero(colliding)).tolist()):
+                sq_width = int(squirrel_objs['width'][i])
+                sq_height = int(squirrel_objs['height'][i])
+                if sq_width * sq_height <= player_obj['size']**2:
+                    # player is larger and eats the squirrel
+                    player_obj['size'] += int( (sq_width * sq_height)**0.2 ) + 1
+                    eaten.append(i)
+                    if player_obj['size'] > WINSIZE:
+                        win_mode = True # turn on "win mode"
+
+                elif not invulnerable_mode:
+                    # player is smaller and takes damage
+                    invulnerable_mode = True
+                    invulnerable_start_time = time.time()
+                    player_obj['health'] -= 1
+                    if player_obj['health'] == 0:
+                        game_over_mode = True # turn on "game over mode"
+                        game_over_start_time = time.time()
+            if eaten:
+                # the player grew, so scale its image once for all of them
+                squirrel_objs.remove(eaten)
+                player_obj['surface'] = get_squirrel_image(player_obj['facing'], player_obj['size'], player_obj['size'])
         else:
             # game is over, show "game over" text
             DISPLAYSURF.blit(game_over_surf, game_over_rect)
@@ -331,6 +324,17 @@ def get_bounce_amount(current_bounce, bounce_rate, bounce_height):
     # current_bounce will always be less than bounce_rate
     return int(math.sin( (math.pi / float(bounce_rate)) * current_bounce) * bounce_height)
 
+def make_bounce_table(max_bounce_rate, max_bounce_height):
+    # Return an int array where [bounce_rate, bounce_height, current_bounce]
+    # is get_bounce_amount(current_bounce, bounce_rate, bounce_height), for
+    # every bounce rate from 1 and height from 0 up to the maximums.
+    table = numpy.zeros((max_bounce_rate + 1, max_bounce_height + 1, max_bounce_rate + 1), dtype=numpy.int64)
+    for bounce_rate in range(1, max_bounce_rate + 1):
+        for bounce_height in range(max_bounce_height + 1):
+            for current_bounce in range(bounce_rate + 1):
+                table[bounce_rate, bounce_height, current_bounce] = get_bounce_amount(current_bounce, bounce_rate, bounce_height)
+    return table
+
 def get_random_velocity():
     speed = random.randint(SQUIRRELMINSPEED, SQUIRRELMAXSPEED)
     if random.randint(0, 1) == 0:
@@ -338,6 +342,12 @@ def get_random_velocity():
     else:
         return -speed
 
+def get_random_velocities(rng, count):
+    # The same as get_random_velocity(), for count squirrels at once with
+    # a NumPy random generator.
+    speeds = rng.integers(SQUIRRELMINSPEED, SQUIRRELMAXSPEED + 1, count)
+    return numpy.where(rng.integers(0, 2, count) == 0, speeds, -speeds)
+
 def get_random_off_camera_pos(camerax, cameray, obj_width, obj_height):
     # Returns a position of the object outside of the camera view.
 
@@ -352,6 +362,27 @@ def get_random_off_camera_pos(camerax, cameray, obj_width, obj_height):
         if not obj_rect.colliderect(camera_rect):
             return x, y
 
+def get_squirrel_image(facing, width, height):
+    # Returns the squirrel image facing LEFT or RIGHT scaled to width and
+    # height, from the squirrel image cache if it has been made before.
+    key = (facing, width, height)
+    if key in SQUIRRELIMAGECACHE:
+        SQUIRRELIMAGECACHESTATS['hits'] += 1
+        SQUIRRELIMAGECACHE.move_to_end(key) # now the most recently used
+        return SQUIRRELIMAGECACHE[key]
+
+    SQUIRRELIMAGECACHESTATS['misses'] += 1
+    if facing == LEFT:
+        image = pygame.transform.scale(L_SQUIR_IMG, (width, height))
+    else:
+        image = pygame.transform.scale(R_SQUIR_IMG, (width, height))
+    if width * height > SQUIRRELIMAGECACHEMAXAREA:
+        return image # a growing player would fill the cache with huge images
+    SQUIRRELIMAGECACHE[key] = image
+    if len(SQUIRRELIMAGECACHE) > SQUIRRELIMAGECACHESIZE:
+        SQUIRRELIMAGECACHE.popitem(last=False) # throw out the least recently used
+    return image
+
 def make_new_squirrel(camerax, cameray):
     sq = {}
     general_size = random.randint(5, 25)
@@ -361,32 +392,119 @@ def make_new_squirrel(camerax, cameray):
     sq['x'], sq['y'] = get_random_off_camera_pos(camerax, cameray, sq['width'], sq['height'])
     sq['movex'] = get_random_velocity()
     sq['movey'] = get_random_velocity()
-    if sq['movex'] < 0: # squirrel is facing left
-        sq['surface'] = pygame.transform.scale(L_SQUIR_IMG, (sq['width'], sq['height']))
-    else: # squirrel is facing right
-        sq['surface'] = pygame.transform.scale(R_SQUIR_IMG, (sq['width'], sq['height']))
     sq['bounce'] = 0
-    sq['bouncerate'] = random.randint(10, 18)
-    sq['bounceheight'] = random.randint(10, 50)
+    sq['bouncerate'] = random.randint(10, SQUIRRELMAXBOUNCERATE)
+    sq['bounceheight'] = random.randint(10, SQUIRRELMAXBOUNCEHEIGHT)
+    sq['surface'] = get_squirrel_image(get_facing(sq['movex']), sq['width'], sq['height'])
     return sq
 
-def make_new_grass(camerax, cameray):
-    gr = {}
-    gr['grass_image'] = random.randint(0, len(GRASSIMAGES) - 1)
-    gr['width'] = GRASSIMAGES[0].get_width()
-    gr['height'] = GRASSIMAGES[0].get_height()
-    gr['x'], gr['y'] = get_random_off_camera_pos(camerax, cameray, gr['width'], gr['height'])
-    gr['rect'] = pygame.Rect( (gr['x'], gr['y'], gr['width'], gr['height']) )
-    return gr
-
-def is_outside_active_area(camerax, cameray, obj):
-    # Return False if camerax and cameray are more than
-    # a half-window length beyond the edge of the window.
-    bounds_left_edge = camerax - WINWIDTH
-    bounds_top_edge = cameray - WINHEIGHT
-    bounds_rect = pygame.Rect(bounds_left_edge, bounds_top_edge, WINWIDTH * 3, WINHEIGHT * 3)
-    obj_rect = pygame.Rect(obj['x'], obj['y'], obj['width'], obj['height'])
-    return not bounds_rect.colliderect(obj_rect)
+def get_facing(movex):
+    # Returns which way a squirrel moving movex pixels across faces.
+    if movex > 0:
+        return RIGHT
+    return LEFT
+
+def get_chunk_grass(grass_seed, chunkx, chunky):
+    # Returns a list of the grass objects in a chunk of the background.
+    # The same seed and chunk always give the same grass.
+    chunk_random = random.Random('%s %s %s' % (grass_seed, chunkx, chunky))
+    grass_objs = []
+    for i in range(GRASSPERCHUNK):
+        gr = {}
+        gr['grass_image'] = chunk_random.randint(0, len(GRASSIMAGES) - 1)
+        gr['width'] = GRASSIMAGES[0].get_width()
+        gr['height'] = GRASSIMAGES[0].get_height()
+        gr['x'] = chunkx * WINWIDTH + chunk_random.randint(0, WINWIDTH - 1)
+        gr['y'] = chunky * WINHEIGHT + chunk_random.randint(0, WINHEIGHT - 1)
+        grass_objs.append(gr)
+    return grass_objs
+
+def make_grass_chunk(grass_seed, chunkx, chunky):
+    # Returns a Surface with a chunk of the background drawn on it. Grass
+    # can hang over the right and bottom edges of its chunk, so the grass
+    # of the chunks to the left and above is drawn too (in the same order
+    # in every chunk, so where grass overlaps it looks the same on both
+    # sides of the edge).
+    chunk_surf = pygame.Surface((WINWIDTH, WINHEIGHT))
+    chunk_surf.fill(GRASSCOLOR)
+    for grass_chunkx in (chunkx - 1, chunkx):
+        for grass_chunky in (chunky - 1, chunky):
+            for gr in get_chunk_grass(grass_seed, grass_chunkx, grass_chunky):
+                chunk_surf.blit(GRASSIMAGES[gr['grass_image']],
+                                (gr['x'] - chunkx * WINWIDTH, gr['y'] - chunky * WINHEIGHT))
+    return chunk_surf
+
+def draw_grass_chunks(grass_chunks, grass_seed, camerax, cameray):
+    # Draw the chunks of the background that are on the screen (at most
+    # two across and two down, since they are the size of the window),
+    # making the ones that aren't in grass_chunks yet, then throw out the
+    # chunks that are far from the screen.
+    left_chunk = camerax // WINWIDTH
+    top_chunk = cameray // WINHEIGHT
+    right_chunk = (camerax + WINWIDTH - 1) // WINWIDTH
+    bottom_chunk = (cameray + WINHEIGHT - 1) // WINHEIGHT
+    for chunkx in range(left_chunk, right_chunk + 1):
+        for chunky in range(top_chunk, bottom_chunk + 1):
+            if (chunkx, chunky) not in grass_chunks:
+                grass_chunks[(chunkx, chunky)] = make_grass_chunk(grass_seed, chunkx, chunky)
+            DISPLAYSURF.blit(grass_chunks[(chunkx, chunky)], (chunkx * WINWIDTH - camerax, chunky * WINHEIGHT - cameray))
+
+    for chunkx, chunky in list(grass_chunks):
+        if (chunkx < left_chunk - GRASSCHUNKKEEP or chunkx > right_chunk + GRASSCHUNKKEEP or
+            chunky < top_chunk - GRASSCHUNKKEEP or chunky > bottom_chunk + GRASSCHUNKKEEP):
+            del grass_chunks[(chunkx, chunky)]
+
+def move_squirrels(squirrels, rng):
+    # Move all the squirrels in the store, adjust their bounce, and change
+    # the direction of DIRCHANGEFREQ % of them at random.
+    squirrels['x'] += squirrels['movex']
+    squirrels['y'] += squirrels['movey']
+    bounces = squirrels['bounce']
+    bounces += 1
+    bounces[bounces > squirrels['bouncerate']] = 0 # reset bounce amount
+
+    changing = numpy.flatnonzero(rng.integers(0, 100, len(squirrels)) < DIRCHANGEFREQ)
+    was_facing_right = squirrels['movex'][changing] > 0
+    squirrels['movex'][changing] = get_random_velocities(rng, len(changing))
+    squirrels['movey'][changing] = get_random_velocities(rng, len(changing))
+
+    # the squirrels that turned around need the image facing the other way
+    turned = changing[(squirrels['movex'][changing] > 0) != was_facing_right]
+    for i in turned.tolist():
+        squirrels['surface'][i] = get_squirrel_image(get_facing(squirrels['movex'][i]),
+                                                     int(squirrels['width'][i]), int(squirrels['height'][i]))
+
+def get_bounce_amounts(squirrels):
+    # The same as get_bounce_amount(), for all the squirrels in the store.
+    return BOUNCETABLE[squirrels['bouncerate'], squirrels['bounceheight'], squirrels['bounce']]
+
+def draw_squirrels(squirrels, camerax, cameray):
+    # Draw the squirrels in the store that are on the screen, in the order
+    # they were made, and return the game world y of their top edges.
+    tops = squirrels['y'] - get_bounce_amounts(squirrels)
+    on_screen = get_overlapping(squirrels, tops, camerax, cameray, WINWIDTH, WINHEIGHT)
+    surfaces = squirrels['surface']
+    for i in squirrels.in_order(numpy.flatnonzero(on_screen)).tolist():
+        DISPLAYSURF.blit(surfaces[i], (int(squirrels['x'][i]) - camerax, int(tops[i]) - cameray))
+    return tops
+
+def get_overlapping(store, tops, x, y, width, height):
+    # Return a bool array of which objects in the store overlap an area of
+    # the game world, when their top edges are at tops (the same test as
+    # Rect.colliderect()). With only the screen and the player to test
+    # each frame, testing every object at once is quicker than keeping a
+    # grid of where they are.
+    return ((store['x'] < x + width) & (x < store['x'] + store['width']) &
+            (tops < y + height) & (y < tops + store['height']))
+
+def get_outside_active_area(camerax, cameray, store):
+    # Return a bool array of which objects in the store are more than a
+    # half-window length beyond the edge of the window.
+    return ~get_overlapping(store, store['y'], camerax - WINWIDTH, cameray - WINHEIGHT, WINWIDTH * 3, WINHEIGHT * 3)
+
+# Made once when the program starts, so the bounces of the player and the
+# squirrels are looked up instead of calling math.sin() every frame.
+BOUNCETABLE = make_bounce_table(max(BOUNCERATE, SQUIRRELMAXBOUNCERATE), max(BOUNCEHEIGHT, SQUIRRELMAXBOUNCEHEIGHT))
 
 if __name__ == '__main__':
     main()
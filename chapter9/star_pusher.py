@@ -3,7 +3,7 @@
 # http://inventwithpython.com/pygame
 # Creative Commons BY-NC-SA 3.0 US
 
-import random, sys, copy, os, pygame
+import random, sys, copy, os, collections, mmap, struct, pygame
 from pygame.locals import *
 
 FPS = 30 # frames per second to update the screen
@@ -19,6 +19,14 @@ TILEFLOORHEIGHT = 45
 
 CAM_MOVE_SPEED = 5 # how many pixels per frame the camera moves
 
+# The map is drawn in chunks of this many pixels wide and high (8 x 8
+# spaces), and only the chunks that are on the screen are drawn and kept.
+# Chunks further than CHUNK_KEEP_DISTANCE pixels off the screen are thrown
+# away, so huge maps don't need one huge Surface.
+CHUNK_WIDTH = 8 * TILEWIDTH
+CHUNK_HEIGHT = 8 * (TILEHEIGHT - TILEFLOORHEIGHT)
+CHUNK_KEEP_DISTANCE = 400
+
 # The percentage of outdoor tiles that have additional
 # decoration on them, such as a tree or rock
 OUTSIDE_DECORATION_PCT = 20
@@ -28,11 +36,67 @@ WHITE      = (255, 255, 255)
 BGCOLOR    = BRIGHTBLUE
 TEXTCOLOR  = WHITE
 
+# The image file for each of the names used as keys in IMAGESDICT.
+IMAGE_FILES = {'uncovered goal': 'RedSelector.png',
+               'covered goal': 'Selector.png',
+               'star': 'Star.png',
+               'corner': 'Wall_Block_Tall.png',
+               'wall': 'Wood_Block_Tall.png',
+               'inside floor': 'Plain_Block.png',
+               'outside floor': 'Grass_Block.png',
+               'title': 'star_title.png',
+               'solved': 'star_solved.png',
+               'princess': 'princess.png',
+               'boy': 'boy.png',
+               'catgirl': 'catgirl.png',
+               'horngirl': 'horngirl.png',
+               'pinkgirl': 'pinkgirl.png',
+               'rock': 'Rock.png',
+               'short tree': 'Tree_Short.png',
+               'tall tree': 'Tree_Tall.png',
+               'ugly tree': 'Tree_Ugly.png'}
+# The file where the decoded pixels of the images are kept between runs.
+IMAGE_CACHE_FILENAME = 'starPusherImages.cache'
+ATLAS_WIDTH = 512 # the width of the Surface the tile-sized images are packed into
+
 UP = 'up'
 DOWN = 'down'
 LEFT = 'left'
 RIGHT = 'right'
 
+# The move log used for undo/redo stores each move as a single byte: the
+# index of the direction in MOVE_DIRECTIONS times two, plus one if a star
+# was pushed by the move. See get_move_code().
+MOVE_DIRECTIONS = (UP, RIGHT, DOWN, LEFT)
+
+# The random 63-bit numbers used for Zobrist hashing of game states. There
+# is one number per map cell for the player and one for a star. They come
+# from their own seeded generator so the keys are the same every run and
+# the decorations' random numbers are not disturbed. The lists grow as
+# bigger maps are loaded.
+ZOBRIST_RANDOM = random.Random(9)
+ZOBRIST_PLAYER_KEYS = []
+ZOBRIST_STAR_KEYS = []
+
+"""
+The game state object is an immutable GameState tuple with these fields:
+    'player' - the cell number of the player's position.
+    'stars' - an int used as a bitset, bit N is set if a star is on cell N.
+    'zobrist' - the Zobrist hash of the player and star positions.
+
+A cell number is x * map_height + y, see get_cell(). Because the state is
+immutable, make_move() returns a new state instead of changing the old
+one, and a level can be reset by just reusing its start state.
+"""
+
+class GameState(collections.namedtuple('GameState', 'player stars zobrist')):
+    __slots__ = () # keep the state as small as a plain tuple
+
+    def __hash__(self):
+        # The Zobrist hash is kept up to date by make_move(), so there is
+        # no need to hash the (possibly big) stars int every time.
+        return self.zobrist
+
 
 def main():
     global FPSCLOCK, DISPLAYSURF, IMAGESDICT, TILEMAPPING, OUTSIDEDECOMAPPING, BASICFONT, PLAYERIMAGES, current_image
@@ -50,26 +114,10 @@ def main():
     pygame.display.set_caption('Star Pusher')
     BASICFONT = pygame.font.Font('freesansbold.ttf', 18)
 
-    # A global dict value that will contain all the Pygame
-    # Surface objects returned by pygame.image.load().
-    IMAGESDICT = {'uncovered goal': pygame.image.load('RedSelector.png'),
-                  'covered goal': pygame.image.load('Selector.png'),
-                  'star': pygame.image.load('Star.png'),
-                  'corner': pygame.image.load('Wall_Block_Tall.png'),
-                  'wall': pygame.image.load('Wood_Block_Tall.png'),
-                  'inside floor': pygame.image.load('Plain_Block.png'),
-                  'outside floor': pygame.image.load('Grass_Block.png'),
-                  'title': pygame.image.load('star_title.png'),
-                  'solved': pygame.image.load('star_solved.png'),
-                  'princess': pygame.image.load('princess.png'),
-                  'boy': pygame.image.load('boy.png'),
-                  'catgirl': pygame.image.load('catgirl.png'),
-                  'horngirl': pygame.image.load('horngirl.png'),
-                  'pinkgirl': pygame.image.load('pinkgirl.png'),
-                  'rock': pygame.image.load('Rock.png'),
-                  'short tree': pygame.image.load('Tree_Short.png'),
-                  'tall tree': pygame.image.load('Tree_Tall.png'),
-                  'ugly tree': pygame.image.load('Tree_Ugly.png')}
+    # A global dict value that will contain all the Pygame Surface
+    # objects for the images in IMAGE_FILES. See load_images() for how
+    # they are loaded.
+    IMAGESDICT = load_images(IMAGE_FILES, IMAGE_CACHE_FILENAME)
     
     # These dict values are global, and map the character that appears
     # in the level file to the Surface object it represents.
@@ -95,7 +143,15 @@ def main():
 
     # Read in the levels from the text file. See the read_levels_file() for
     # details on the format of this file and how to make your own levels.
-    levels = read_levels_file('starPusherLevels.txt')
+    # open_levels_file() keeps a compiled copy of the file so that only
+    # the levels that are played get loaded.
+    levels = open_levels_file('starPusherLevels.txt')
+    try:
+        play_levels(levels)
+    finally:
+        levels.close() # terminate() exits by raising SystemExit
+
+def play_levels(levels):
     current_level_index = 0
 
     # The main game loop. This loop runs a single level, when the user
@@ -123,18 +179,30 @@ def run_level(levels, level_num):
     global current_image
 
     level_obj = levels[level_num]
-    map_obj = decorate_map(level_obj['map_obj'], level_obj['start_state']['player'])
-    game_state_obj = copy.deepcopy(level_obj['start_state'])
-    map_needs_redraw = True # set to True to call draw_map()
+    start_xy = get_cell_xy(level_obj['map_obj'], level_obj['start_state'].player)
+    map_obj = decorate_map(level_obj['map_obj'], start_xy)
+    game_state_obj = level_obj['start_state'] # states are immutable, no copy needed
+    step_counter = 0
+    map_renderer = make_map_renderer(map_obj, level_obj['goals'])
+    map_needs_redraw = False # set to True to redraw all of the map's chunks
+    changed_cells = [] # (x, y) map spaces that need to be redrawn in the chunks
+    move_log = bytearray() # a move code for each move made, for undo/redo
+    move_log_position = 0 # moves after this position have been undone
+    screen_needs_redraw = True # set to True to redraw the whole window
+    last_step_rect = pygame.Rect(0, 0, 0, 0)
     level_surf = BASICFONT.render('Level %s of %s' % (level_num + 1, len(levels)), 1, TEXTCOLOR)
     level_rect = level_surf.get_rect()
     level_rect.bottomleft = (20, WINHEIGHT - 35)
-    map_width = len(map_obj) * TILEWIDTH # the size of the width of the maps in pixels
-    map_height = (len(map_obj[0]) - 1) * (TILEHEIGHT - TILEFLOORHEIGHT) + TILEHEIGHT # ????
+    map_width = map_renderer['width'] # the size of the width of the maps in pixels
+    map_height = map_renderer['height']
     MAX_CAM_X_PAN = abs(HALF_WINHEIGHT - int(map_height / 2)) + TILEWIDTH
     MAX_CAM_Y_PAN = abs(HALF_WINWIDTH - int(map_width / 2)) + TILEHEIGHT
 
     level_is_complete = False
+    level_is_deadlocked = is_deadlocked(level_obj, game_state_obj)
+    deadlock_surf = BASICFONT.render('No solution possible from here. U to undo.', 1, TEXTCOLOR)
+    deadlock_rect = deadlock_surf.get_rect()
+    deadlock_rect.bottomright = (WINWIDTH - 20, WINHEIGHT - 10)
     # Track how much the camera has moved:
     camera_offset_x = 0
     camera_offset_y = 0
@@ -147,6 +215,7 @@ def run_level(levels, level_num):
     while True: # main game loop
         # Reset these variables:
         player_move_to = None
+        undo_moves = 0 # how many moves to undo (or redo, if negative)
         key_pressed = False
 
         for event in pygame.event.get(): # event handling loop
@@ -185,6 +254,10 @@ def run_level(levels, level_num):
                     terminate()
                 elif event.key == K_BACKSPACE:
                     return 'reset' # Reset the level.
+                elif event.key == K_u:
+                    undo_moves += 1
+                elif event.key == K_r:
+                    undo_moves -= 1
                 elif event.key == K_p:
                     # Change the player image to the next one.
                     current_image += 1
@@ -204,27 +277,73 @@ def run_level(levels, level_num):
                 elif event.key == K_s:
                     camera_down = False
 
+        new_game_state_obj = None
         if player_move_to != None and not level_is_complete:
             # If the player pushed a key to move, make the move
             # (if possible) and push any starts that are pushable
-            moved = make_move(map_obj, game_state_obj, player_move_to)
-
-            if moved:
+            new_game_state_obj = make_move(map_obj, game_state_obj, player_move_to)
+
+            if new_game_state_obj != None:
+                # Log the move. Any moves that were undone can't be
+                # redone anymore after a new move.
+                del move_log[move_log_position:]
+                move_log.append(get_move_code(player_move_to, new_game_state_obj.stars != game_state_obj.stars))
+                move_log_position += 1
                 # increment the step counter.
-                game_state_obj['step_counter'] +=  1
-                map_needs_redraw = True
+                step_counter += 1
+
+                # See if a star was pushed into a spot where the level
+                # can't be solved anymore. Only the pushed star can have
+                # become frozen by this move.
+                # (A deadlock is for good, frozen stars never move again.)
+                pushed_stars = new_game_state_obj.stars & ~game_state_obj.stars
+                if pushed_stars and not level_is_deadlocked:
+                    level_is_deadlocked = is_deadlocked(level_obj, new_game_state_obj, pushed_stars.bit_length() - 1)
+                    if level_is_deadlocked:
+                        screen_needs_redraw = True # show the message
+
+        elif undo_moves != 0 and not level_is_complete:
+            # Step back (or forward again) through the move log.
+            new_game_state_obj = game_state_obj
+            while undo_moves > 0 and move_log_position > 0:
+                move_log_position -= 1
+                new_game_state_obj = undo_move(map_obj, new_game_state_obj, move_log[move_log_position])
+                step_counter -= 1
+                undo_moves -= 1
+            while undo_moves < 0 and move_log_position < len(move_log):
+                direction = MOVE_DIRECTIONS[move_log[move_log_position] >> 1]
+                new_game_state_obj = make_move(map_obj, new_game_state_obj, direction)
+                move_log_position += 1
+                step_counter += 1
+                undo_moves += 1
+
+            was_deadlocked = level_is_deadlocked
+            level_is_deadlocked = is_deadlocked(level_obj, new_game_state_obj)
+            if level_is_deadlocked != was_deadlocked:
+                screen_needs_redraw = True # show or hide the message
+
+        if new_game_state_obj != None:
+            # Only the spaces the player and stars moved between
+            # have to be redrawn.
+            changed_cells.extend(get_changed_cells(map_obj, game_state_obj, new_game_state_obj))
+            game_state_obj = new_game_state_obj
 
             if is_level_finished(level_obj, game_state_obj):
                 # level is solved, we should show the "Solved!" image.
                 level_is_complete = True
                 key_pressed = False
 
-        DISPLAYSURF.fill(BGCOLOR)
-
+        dirty_rects = [] # the parts of the map that were redrawn this frame
         if map_needs_redraw:
-            map_surf = draw_map(map_obj, game_state_obj, level_obj['goals'])
+            map_renderer['chunks'] = {} # the chunks are drawn again as needed
             map_needs_redraw = False
+            changed_cells = []
+            screen_needs_redraw = True
+        elif changed_cells:
+            dirty_rects = update_map_cells(map_renderer, game_state_obj, changed_cells)
+            changed_cells = []
 
+        old_camera_offset = (camera_offset_x, camera_offset_y)
         if camera_up and camera_offset_y < MAX_CAM_X_PAN:
             camera_offset_y += CAM_MOVE_SPEED
         elif camera_down and camera_offset_y > -MAX_CAM_X_PAN:
@@ -233,31 +352,60 @@ def run_level(levels, level_num):
             camera_offset_x += CAM_MOVE_SPEED
         elif camera_right and camera_offset_x > -MAX_CAM_Y_PAN:
             camera_offset_x -= CAM_MOVE_SPEED
+        if (camera_offset_x, camera_offset_y) != old_camera_offset:
+            screen_needs_redraw = True # the whole map moved on the screen
 
-        # Adjust map_surf's rect object based on the camera offset.
-        map_surf_rect = map_surf.get_rect()
+        # Position the map's rect object based on the camera offset.
+        map_surf_rect = pygame.Rect(0, 0, map_renderer['width'], map_renderer['height'])
         map_surf_rect.center = (HALF_WINWIDTH + camera_offset_x, HALF_WINHEIGHT + camera_offset_y)
 
-        # Draw map_surf to the DISPLAYSURF Surface object.
-        DISPLAYSURF.blit(map_surf, map_surf_rect)
-
-        DISPLAYSURF.blit(level_surf, level_rect)
-        step_surf = BASICFONT.render('Steps: %s' % (game_state_obj['step_counter']), 1, TEXTCOLOR)
+        step_surf = BASICFONT.render('Steps: %s' % (step_counter), 1, TEXTCOLOR)
         step_rect = step_surf.get_rect()
         step_rect.bottomleft = (20, WINHEIGHT -10)
-        DISPLAYSURF.blit(step_surf, step_rect)
 
-        if level_is_complete:
-            # is solved, show the "Solved!" image until the player
-            # has pressed a key
-            solved_rect = IMAGESDICT['solved'].get_rect()
-            solved_rect.center = (HALF_WINWIDTH, HALF_WINHEIGHT)
-            DISPLAYSURF.blit(IMAGESDICT['solved'], solved_rect)
+        if screen_needs_redraw or level_is_complete:
+            DISPLAYSURF.fill(BGCOLOR)
+
+            # Draw the map chunks that are on the screen to the
+            # DISPLAYSURF Surface object, and forget the far away ones.
+            draw_map_chunks(DISPLAYSURF, map_renderer, game_state_obj, map_surf_rect)
+            evict_map_chunks(map_renderer, DISPLAYSURF.get_rect().move(-map_surf_rect.left, -map_surf_rect.top))
+
+            DISPLAYSURF.blit(level_surf, level_rect)
+            DISPLAYSURF.blit(step_surf, step_rect)
+            if level_is_deadlocked:
+                DISPLAYSURF.blit(deadlock_surf, deadlock_rect)
+
+            if level_is_complete:
+                # is solved, show the "Solved!" image until the player
+                # has pressed a key
+                solved_rect = IMAGESDICT['solved'].get_rect()
+                solved_rect.center = (HALF_WINWIDTH, HALF_WINHEIGHT)
+                DISPLAYSURF.blit(IMAGESDICT['solved'], solved_rect)
+
+                if key_pressed:
+                    return 'solved'
+
+            pygame.display.update() # draw DISPLAYSURF to the screen.
+            screen_needs_redraw = False
+        elif dirty_rects:
+            # Only the redrawn spaces of the map and the step counter
+            # changed, so only those parts of the window are redrawn and
+            # sent to the screen.
+            screen_rects = [rect.move(map_surf_rect.topleft) for rect in dirty_rects]
+            screen_rects.append(step_rect.union(last_step_rect))
+            for rect in screen_rects:
+                DISPLAYSURF.set_clip(rect)
+                DISPLAYSURF.fill(BGCOLOR)
+                draw_map_chunks(DISPLAYSURF, map_renderer, game_state_obj, map_surf_rect)
+                DISPLAYSURF.blit(level_surf, level_rect)
+                DISPLAYSURF.blit(step_surf, step_rect)
+                if level_is_deadlocked:
+                    DISPLAYSURF.blit(deadlock_surf, deadlock_rect)
+            DISPLAYSURF.set_clip(None)
+            pygame.display.update(screen_rects)
+        last_step_rect = step_rect
 
-            if key_pressed:
-                return 'solved'
-
-        pygame.display.update() # draw DISPLAYSURF to the screen.
         FPSCLOCK.tick()
 
 def is_wall(map_obj, x, y):
@@ -269,6 +417,53 @@ def is_wall(map_obj, x, y):
         return True # wall is blocking
     return False
 
+def is_floor(map_obj, x, y):
+    """Returns True if the (x, y) position is on the map and not a wall,
+    otherwise return False."""
+    if x < 0 or x >= len(map_obj) or y < 0 or y >= len(map_obj[x]):
+        return False
+    return not is_wall(map_obj, x, y)
+
+def get_cell(map_obj, x, y):
+    """Returns the cell number of the (x, y) position on the map."""
+    return x * len(map_obj[0]) + y
+
+def get_cell_xy(map_obj, cell):
+    """Returns the (x, y) position of the cell number on the map."""
+    return divmod(cell, len(map_obj[0]))
+
+def get_cells_mask(map_obj, positions):
+    """Returns an int with the bit set for each (x, y) position in the
+    positions list."""
+    mask = 0
+    for x, y in positions:
+        mask |= 1 << get_cell(map_obj, x, y)
+    return mask
+
+def make_game_state(map_obj, player, stars):
+    """Returns a GameState for the player's (x, y) position and the list
+    of (x, y) star positions on the map."""
+    num_cells = len(map_obj) * len(map_obj[0])
+    while len(ZOBRIST_STAR_KEYS) < num_cells:
+        ZOBRIST_PLAYER_KEYS.append(ZOBRIST_RANDOM.getrandbits(63))
+        ZOBRIST_STAR_KEYS.append(ZOBRIST_RANDOM.getrandbits(63))
+
+    player_cell = get_cell(map_obj, player[0], player[1])
+    zobrist = ZOBRIST_PLAYER_KEYS[player_cell]
+    for x, y in stars:
+        zobrist ^= ZOBRIST_STAR_KEYS[get_cell(map_obj, x, y)]
+    return GameState(player_cell, get_cells_mask(map_obj, stars), zobrist)
+
+def get_star_cells(game_state_obj):
+    """Returns a list of the cell numbers that have a star on them."""
+    cells = []
+    stars = game_state_obj.stars
+    while stars:
+        lowest_bit = stars & -stars
+        cells.append(lowest_bit.bit_length() - 1)
+        stars ^= lowest_bit
+    return cells
+
 def decorate_map(map_obj, startxy): # ????
     """Makes a copy of the given map object and modifies it.
     Here is what is done to it:
@@ -289,8 +484,14 @@ def decorate_map(map_obj, startxy): # ????
             if map_obj_copy[x][y] in ('$', '.', '@', '+', '*'):
                 map_obj_copy[x][y] = ' '
 
-    # Flood fill to determine inside/outside floor tiles.
-    flood_fill(map_obj_copy, startx, starty, ' ', 'o') 
+    # Label the areas of floor to determine inside/outside floor tiles.
+    # The floor in the same area as the player's start is inside floor.
+    labels, num_regions = label_regions(map_obj_copy, (' ',))
+    inside_label = labels[startx][starty]
+    for x in range(len(map_obj_copy)):
+        for y in range(len(map_obj_copy[0])):
+            if labels[x][y] == inside_label:
+                map_obj_copy[x][y] = 'o'
 
     # Convert the adjoined walls into corner tiles.
     for x in range(len(map_obj_copy)):
@@ -315,24 +516,21 @@ def is_blocked(map_obj, game_state_obj, x, y):
         return True
     elif x < 0 or x >= len(map_obj) or y < 0 or y >= len(map_obj[x]):
         return True # x and y aren't actually on the map.
-    elif (x, y) in game_state_obj['stars']:
+    elif game_state_obj.stars >> get_cell(map_obj, x, y) & 1:
         return True # a star is blocking
 
     return False
 
 def make_move(map_obj, game_state_obj, player_move_to):
     """Given a map and game state object, see if it is possible for the
-    player to make the given move. If it is, then change the player's
-    position (and the position of any pushed star). If not, do nothing.
+    player to make the given move. If it is, then return a new game state
+    with the player's position (and the position of any pushed star)
+    changed. The game state passed in is never changed.
 
-    Returns True if the player moved, otherwise False."""
+    Returns the new game state if the player moved, otherwise None."""
 
     # Make sure the player can move in the direction they want.
-    playerx, playery = game_state_obj['player']
-
-    # This variable is "syntactic sugar". Typing "stars" is more
-    # readable than typing "game_state_obj['stars']" in our code.
-    stars = game_state_obj['stars']
+    playerx, playery = get_cell_xy(map_obj, game_state_obj.player)
 
     # The code for handling each of the directions is so similar aside
     # from adding or subtracting 1 to the x/y coordinates. We can
@@ -351,20 +549,175 @@ def make_move(map_obj, game_state_obj, player_move_to):
         y_offset = 0
 
     # See if the player can move in that direction.
-    if is_wall(map_obj, playerx + x_offset, playery + y_offset):
-        return False
-    else:
-        if (playerx + x_offset, playery + y_offset) in stars:
-            # There is a star in the way, see if the player can push it.
-            if not is_blocked(map_obj, game_state_obj, playerx + (x_offset*2), playery + (y_offset*2)):
-                # Move the star.
-                ind = stars.index((playerx + x_offset, playery + y_offset))
-                stars[ind] = (stars[ind][0] + x_offset, stars[ind][1] + y_offset)
-            else:
-                return False
-        # Move the player upwards.
-        game_state_obj['player'] = (playerx + x_offset, playery + y_offset)
-        return True
+    newx = playerx + x_offset
+    newy = playery + y_offset
+    if newx < 0 or newx >= len(map_obj) or newy < 0 or newy >= len(map_obj[newx]):
+        return None # the player can't walk off the map
+    if is_wall(map_obj, newx, newy):
+        return None
+
+    player_cell = game_state_obj.player
+    new_player_cell = get_cell(map_obj, newx, newy)
+    stars = game_state_obj.stars
+    zobrist = game_state_obj.zobrist ^ ZOBRIST_PLAYER_KEYS[player_cell] ^ ZOBRIST_PLAYER_KEYS[new_player_cell]
+    if stars >> new_player_cell & 1:
+        # There is a star in the way, see if the player can push it.
+        if is_blocked(map_obj, game_state_obj, newx + x_offset, newy + y_offset):
+            return None
+        # Move the star.
+        new_star_cell = get_cell(map_obj, newx + x_offset, newy + y_offset)
+        stars ^= (1 << new_player_cell) | (1 << new_star_cell)
+        zobrist ^= ZOBRIST_STAR_KEYS[new_player_cell] ^ ZOBRIST_STAR_KEYS[new_star_cell]
+    # Move the player.
+    return GameState(new_player_cell, stars, zobrist)
+
+def get_move_code(player_move_to, pushed):
+    """Returns the move log byte for a move in the player_move_to
+    direction. pushed is True if the move pushed a star."""
+    return MOVE_DIRECTIONS.index(player_move_to) * 2 + int(pushed)
+
+def undo_move(map_obj, game_state_obj, move_code):
+    """Returns the game state from before the move in move_code was made,
+    given the game state from after it. This is the reverse of make_move():
+    the player steps back, pulling the pushed star along if there was one."""
+    player_move_to = MOVE_DIRECTIONS[move_code >> 1]
+    # How the cell number changes for one step in the move's direction.
+    height = len(map_obj[0])
+    step = {UP: -1, DOWN: 1, LEFT: -height, RIGHT: height}[player_move_to]
+
+    player_cell = game_state_obj.player
+    old_player_cell = player_cell - step
+    stars = game_state_obj.stars
+    zobrist = game_state_obj.zobrist ^ ZOBRIST_PLAYER_KEYS[player_cell] ^ ZOBRIST_PLAYER_KEYS[old_player_cell]
+    if move_code & 1:
+        # Pull the star back from in front of the player to where the
+        # player is standing now.
+        star_cell = player_cell + step
+        stars ^= (1 << star_cell) | (1 << player_cell)
+        zobrist ^= ZOBRIST_STAR_KEYS[star_cell] ^ ZOBRIST_STAR_KEYS[player_cell]
+    return GameState(old_player_cell, stars, zobrist)
+
+def load_images(image_files, cache_filename):
+    """Returns a dict of Surface objects for the image_files dict, which
+    maps a name to an image filename. The Surfaces are converted to the
+    display's pixel format (with convert_alpha()) so that blitting them
+    doesn't have to convert every pixel, and the tile-sized images are
+    packed into one atlas Surface. The decoded pixels are saved to the
+    cache file, so that later runs don't have to decode the PNG files
+    again unless they have changed."""
+    decoded_images = read_image_cache(image_files, cache_filename)
+    if decoded_images == None:
+        decoded_images = {}
+        for name, filename in image_files.items():
+            image = pygame.image.load(filename)
+            decoded_images[name] = (image.get_size(), pygame.image.tostring(image, 'RGBA'))
+        try:
+            write_image_cache(image_files, decoded_images, cache_filename)
+        except OSError:
+            pass # the cache is only a speed up, the game works without it
+
+    # Pack the images that are the size of a tile into the atlas, shelf by
+    # shelf: a row of images left to right, then the next row below it.
+    atlas_rects = {}
+    shelf_x = 0
+    shelf_y = 0
+    for name in sorted(decoded_images):
+        (width, height), pixels = decoded_images[name]
+        if (width, height) != (TILEWIDTH, TILEHEIGHT):
+            continue # big images like the title are kept on their own
+        if shelf_x + width > ATLAS_WIDTH:
+            shelf_x = 0
+            shelf_y += TILEHEIGHT
+        atlas_rects[name] = pygame.Rect(shelf_x, shelf_y, width, height)
+        shelf_x += width
+
+    images = {}
+    atlas_surf = None
+    if atlas_rects:
+        atlas_surf = pygame.Surface((ATLAS_WIDTH, shelf_y + TILEHEIGHT), SRCALPHA)
+    for name in decoded_images:
+        size, pixels = decoded_images[name]
+        image = pygame.image.fromstring(pixels, size, 'RGBA')
+        if name in atlas_rects:
+            atlas_surf.blit(image, atlas_rects[name])
+        else:
+            images[name] = image.convert_alpha()
+    if atlas_surf != None:
+        atlas_surf = atlas_surf.convert_alpha()
+        for name in atlas_rects:
+            # A subsurface shares the atlas's pixels instead of copying them.
+            images[name] = atlas_surf.subsurface(atlas_rects[name])
+    return images
+
+"""
+The image cache file has a header (IMAGECACHE_HEADER: the b'SPIC' magic,
+the format version and the number of images), then for each image an
+IMAGECACHE_ENTRY (the lengths of the image's name and filename, the size
+and modification time of the image file, and the image's width and
+height) followed by the name, the filename and the RGBA pixels.
+"""
+IMAGECACHE_MAGIC = b'SPIC'
+IMAGECACHE_VERSION = 1
+IMAGECACHE_HEADER = struct.Struct('<4sII')
+IMAGECACHE_ENTRY = struct.Struct('<IIqqII')
+
+def read_image_cache(image_files, cache_filename):
+    """Returns a dict mapping each name in image_files to a tuple of the
+    image's (width, height) and its RGBA pixels as read from the cache
+    file. Returns None if there is no cache file or it doesn't match the
+    current image files."""
+    if not os.path.exists(cache_filename):
+        return None
+    cache_file = open(cache_filename, 'rb')
+    data = cache_file.read()
+    cache_file.close()
+
+    try:
+        magic, version, num_images = IMAGECACHE_HEADER.unpack_from(data, 0)
+        if magic != IMAGECACHE_MAGIC or version != IMAGECACHE_VERSION or num_images != len(image_files):
+            return None
+        decoded_images = {}
+        offset = IMAGECACHE_HEADER.size
+        for i in range(num_images):
+            name_length, filename_length, file_size, file_mtime, width, height = IMAGECACHE_ENTRY.unpack_from(data, offset)
+            offset += IMAGECACHE_ENTRY.size
+            name = data[offset:offset + name_length].decode('utf-8')
+            offset += name_length
+            filename = data[offset:offset + filename_length].decode('utf-8')
+            offset += filename_length
+            if image_files.get(name) != filename:
+                return None # the image files have been changed in the code
+            file_stat = os.stat(filename)
+            if file_stat.st_size != file_size or file_stat.st_mtime_ns != file_mtime:
+                return None # the image file has been changed
+            pixels = data[offset:offset + width * height * 4]
+            offset += width * height * 4
+            if len(pixels) != width * height * 4:
+                return None # the cache file is cut short
+            decoded_images[name] = ((width, height), pixels)
+    except (struct.error, UnicodeDecodeError, OSError):
+        return None # the cache file is broken, so it will be made again
+    return decoded_images
+
+def write_image_cache(image_files, decoded_images, cache_filename):
+    """Writes the decoded images (see read_image_cache()) to the cache
+    file."""
+    chunks = [IMAGECACHE_HEADER.pack(IMAGECACHE_MAGIC, IMAGECACHE_VERSION, len(decoded_images))]
+    for name in decoded_images:
+        (width, height), pixels = decoded_images[name]
+        filename = image_files[name]
+        file_stat = os.stat(filename)
+        name_bytes = name.encode('utf-8')
+        filename_bytes = filename.encode('utf-8')
+        chunks.append(IMAGECACHE_ENTRY.pack(len(name_bytes), len(filename_bytes), file_stat.st_size, file_stat.st_mtime_ns, width, height))
+        chunks.extend((name_bytes, filename_bytes, pixels))
+
+    # Write to a temporary file first, so a half-written cache is never read.
+    temp_filename = cache_filename + '.tmp'
+    cache_file = open(temp_filename, 'wb')
+    cache_file.write(b''.join(chunks))
+    cache_file.close()
+    os.replace(temp_filename, cache_filename)
 
 def start_screen():
     """Display the start screen (which has the title and instructions)
@@ -382,7 +735,7 @@ def start_screen():
     # So we will use a list with each line in it.
     instruction_text = ['Push the stars over the marks.',
         'Arrow keys to move, WASD for camera control, P to change character.',
-        'Backspace to reset level, Esc to quit.',
+        'U to undo a move, R to redo it, Backspace to reset level, Esc to quit.',
         'N for next level, B to go back a level.']
 
     # Start with drawing a blank color to the entire window:
@@ -415,16 +768,26 @@ def start_screen():
         FPSCLOCK.tick()
 
 def read_levels_file(filename):
+    """Reads every level in the level file and returns a list of level
+    objects. See open_levels_file() for a faster way to load big files."""
+    levels = [] # Will contain a list of level objects.
+    for map_text_lines, line_num in read_level_texts(filename):
+        levels.append(make_level_obj(map_text_lines, len(levels), line_num, filename))
+    return levels
+
+def read_level_texts(filename):
+    """Reads the level file and returns a list of (map_text_lines,
+    line_num) tuples, one for each level. map_text_lines is a list of the
+    lines of the level's map with the comments removed, and line_num is
+    the line number of the level's end in the file."""
     assert os.path.exists(filename), 'Cannot find the level file: %s' % (filename)
     map_file = open(filename, 'r')
     # Each level must end with a blank line
     content = map_file.readlines() + ['\r\n']
     map_file.close()
 
-    levels = [] # Will contain a list of level objects.
-    level_num = 0
+    level_texts = []
     map_text_lines = [] # contains the lines for a single level's map.
-    map_obj = [] # the map object made from the data in map_text_lines
     for line_num in range(len(content)):
         # Process each line that was in the level file.
         line = content[line_num].rstrip('\r\n')
@@ -438,146 +801,586 @@ def read_levels_file(filename):
             map_text_lines.append(line)
         elif line == '' and len(map_text_lines) > 0:
             # A blank line indicates the end of a level's map in the file.
-            # Convert the text in map_text_lines into a level object.
-
-            # Find the longest row in the map.
-            max_width = -1
-            for i in range(len(map_text_lines)):
-                if len(map_text_lines[i]) > max_width:
-                    max_width = len(map_text_lines[i])
-            # Add spaces to the ends of the shorter rows.
-            # This ensures the map will be rectangular.
-            for i in range(len(map_text_lines)):
-                map_text_lines[i] += ' ' * (max_width - len(map_text_lines[i]))
-        
-            # Convert map_text_lines to a map object
-            for x in range(len(map_text_lines[0])):
-                map_obj.append([])
-            for y in range(len(map_text_lines)):
-                for x in range(max_width):
-                    map_obj[x].append(map_text_lines[y][x])
-
-            # Loop through the spaces in the map and find the @, ., and $
-            # characters for the starting game state.
-            startx = None # The x and y for the player's starting position
-            starty = None
-            goals = [] # list of (x, y) tuples for each goal.
-            stars = [] # list of (x, y) for each star's starting position.
-
-            for x in range(max_width):
-                for y in range(len(map_obj[x])):
-                    if map_obj[x][y] in ('@', '+'):
-                        # '@' is player, '+' is player & goal
-                        startx = x
-                        starty = y
-                    if map_obj[x][y] in ('.', '+', '*'):
-                        # '.' is goal, '*' is start & goal
-                        goals.append((x, y))
-                    if map_obj[x][y] in ('$', '*'):
-                        # '$' is star
-                        stars.append((x, y))
-
-            # Basic level design sanity checks:
-            assert startx != None and starty != None, 'Level %s (around line %s) in %s is missing a "@" or "+" to mark the start point.' % (level_num+1, line_num, filename)
-            assert len(goals) > 0, 'Level %s (around line %s) in %s must have at least one goal.' % (level_num+1, line_num, filename)
-            assert len(stars) >= len(goals), 'Level %s (around line %s) in %s is impossible to solve. It has %s goals but only %s stars.' % (level_num+1, line_num, filename, len(goals), len(stars))
-
-            # Create level object and starting game state object.
-            game_state_obj = {'player': (startx, starty),
-                'step_counter': 0,
-                'stars': stars}
-            level_obj = {'width': max_width,
-                'height': len(map_obj),
-                'map_obj': map_obj,
-                'goals': goals,
-                'start_state': game_state_obj }
-
-            levels.append(level_obj)
-
-            # Reset the variables for reading the next map.
-            map_text_lines = []
-            map_obj = []
-            game_state_obj = {}
-            level_num += 1
+            level_texts.append((map_text_lines, line_num))
+            map_text_lines = [] # Reset for reading the next map.
+    return level_texts
+
+def make_level_obj(map_text_lines, level_num, line_num, filename):
+    """Converts the text lines of a level's map into a level object.
+    level_num, line_num and filename are only used for error messages."""
+    # Find the longest row in the map.
+    max_width = -1
+    for i in range(len(map_text_lines)):
+        if len(map_text_lines[i]) > max_width:
+            max_width = len(map_text_lines[i])
+    # Add spaces to the ends of the shorter rows.
+    # This ensures the map will be rectangular.
+    map_text_lines = [line + ' ' * (max_width - len(line)) for line in map_text_lines]
+
+    # Convert map_text_lines to a map object
+    map_obj = [] # the map object made from the data in map_text_lines
+    for x in range(len(map_text_lines[0])):
+        map_obj.append([])
+    for y in range(len(map_text_lines)):
+        for x in range(max_width):
+            map_obj[x].append(map_text_lines[y][x])
+
+    # Loop through the spaces in the map and find the @, ., and $
+    # characters for the starting game state.
+    startx = None # The x and y for the player's starting position
+    starty = None
+    goals = [] # list of (x, y) tuples for each goal.
+    stars = [] # list of (x, y) for each star's starting position.
+
+    for x in range(max_width):
+        for y in range(len(map_obj[x])):
+            if map_obj[x][y] in ('@', '+'):
+                # '@' is player, '+' is player & goal
+                startx = x
+                starty = y
+            if map_obj[x][y] in ('.', '+', '*'):
+                # '.' is goal, '*' is start & goal
+                goals.append((x, y))
+            if map_obj[x][y] in ('$', '*'):
+                # '$' is star
+                stars.append((x, y))
+
+    # Basic level design sanity checks:
+    assert startx != None and starty != None, 'Level %s (around line %s) in %s is missing a "@" or "+" to mark the start point.' % (level_num+1, line_num, filename)
+    assert len(goals) > 0, 'Level %s (around line %s) in %s must have at least one goal.' % (level_num+1, line_num, filename)
+    assert len(stars) >= len(goals), 'Level %s (around line %s) in %s is impossible to solve. It has %s goals but only %s stars.' % (level_num+1, line_num, filename, len(goals), len(stars))
+
+    # Create level object and starting game state object.
+    game_state_obj = make_game_state(map_obj, (startx, starty), stars)
+    level_obj = {'width': max_width,
+        'height': len(map_text_lines),
+        'map_obj': map_obj,
+        'goals': goals,
+        'goals_mask': get_cells_mask(map_obj, goals),
+        'dead_squares': find_dead_squares(map_obj, goals),
+        'start_state': game_state_obj }
+    return level_obj
+
+"""
+A compiled level pack is a binary file made from a level text file by
+compile_levels_file(), so that big level files don't have to be read and
+converted all at once when the game starts. The file has:
+    * A header (LEVELPACK_HEADER): the b'SPLP' magic, the format version,
+      and the size and modification time of the text file it was made
+      from, and the number of levels.
+    * An index (LEVELPACK_INDEX_ENTRY per level): the offset and length
+      of the level's map text in the file, and the line number of the
+      level in the text file (for error messages).
+    * The map text of each level, with the lines joined by newlines.
+"""
+LEVELPACK_MAGIC = b'SPLP'
+LEVELPACK_VERSION = 1
+LEVELPACK_HEADER = struct.Struct('<4sIqqI')
+LEVELPACK_INDEX_ENTRY = struct.Struct('<III')
+
+def get_level_pack_filename(filename):
+    """Returns the compiled level pack filename for a level text file."""
+    return os.path.splitext(filename)[0] + '.pack'
+
+def compile_levels_file(filename, pack_filename):
+    """Writes the levels in the level text file to a compiled level pack
+    file. The levels are not checked until they are loaded."""
+    source_stat = os.stat(filename)
+    level_texts = read_level_texts(filename)
+
+    index = []
+    level_data = []
+    offset = LEVELPACK_HEADER.size + LEVELPACK_INDEX_ENTRY.size * len(level_texts)
+    for map_text_lines, line_num in level_texts:
+        data = '\n'.join(map_text_lines).encode('utf-8')
+        index.append(LEVELPACK_INDEX_ENTRY.pack(offset, len(data), line_num))
+        level_data.append(data)
+        offset += len(data)
+
+    # Write to a temporary file first, so that a game that is starting at
+    # the same time never reads a half-written pack.
+    temp_filename = pack_filename + '.tmp'
+    pack_file = open(temp_filename, 'wb')
+    pack_file.write(LEVELPACK_HEADER.pack(LEVELPACK_MAGIC, LEVELPACK_VERSION, source_stat.st_size, source_stat.st_mtime_ns, len(level_texts)))
+    pack_file.write(b''.join(index))
+    pack_file.write(b''.join(level_data))
+    pack_file.close()
+    os.replace(temp_filename, pack_filename)
+
+def is_level_pack_current(filename, pack_filename):
+    """Returns True if the compiled level pack exists and was made from the
+    current version of the level text file, otherwise False."""
+    if not os.path.exists(pack_filename):
+        return False
+    source_stat = os.stat(filename)
+    pack_file = open(pack_filename, 'rb')
+    header = pack_file.read(LEVELPACK_HEADER.size)
+    pack_file.close()
+    if len(header) != LEVELPACK_HEADER.size:
+        return False
+    magic, version, source_size, source_mtime, num_levels = LEVELPACK_HEADER.unpack(header)
+    return (magic == LEVELPACK_MAGIC and version == LEVELPACK_VERSION and
+            source_size == source_stat.st_size and source_mtime == source_stat.st_mtime_ns)
+
+def open_levels_file(filename):
+    """Returns a LevelPack for the level text file, compiling it into a
+    level pack first if there is none or the text file has changed since.
+    If the pack can't be written (for example, the folder is read only),
+    a LevelTexts of the text file is returned instead."""
+    assert os.path.exists(filename), 'Cannot find the level file: %s' % (filename)
+    pack_filename = get_level_pack_filename(filename)
+    try:
+        if not is_level_pack_current(filename, pack_filename):
+            compile_levels_file(filename, pack_filename)
+        try:
+            return LevelPack(pack_filename, filename)
+        except ValueError:
+            # The pack is truncated or corrupt, so make it again the same
+            # way as a pack of an old version of the text file.
+            compile_levels_file(filename, pack_filename)
+            return LevelPack(pack_filename, filename)
+    except (OSError, ValueError):
+        return LevelTexts(filename)
+
+class LevelPack(object):
+    """A read-only list of the level objects in a compiled level pack. The
+    file is memory mapped, and each level is only converted into a level
+    object the first time it is asked for. Raises ValueError if the file
+    isn't a level pack, or its length doesn't match its index (it was
+    cut short or written over)."""
+
+    def __init__(self, pack_filename, filename):
+        self.filename = filename # the text file, for error messages
+        self.pack_file = open(pack_filename, 'rb')
+        try:
+            self.data = mmap.mmap(self.pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # an empty file can't be mapped
+            self.pack_file.close()
+            raise
+        if len(self.data) < LEVELPACK_HEADER.size:
+            self.close()
+            raise ValueError('%s is too short to be a level pack.' % (pack_filename))
+        magic, version, source_size, source_mtime, self.num_levels = LEVELPACK_HEADER.unpack_from(self.data, 0)
+        if magic != LEVELPACK_MAGIC or version != LEVELPACK_VERSION:
+            self.close()
+            raise ValueError('%s is not a version %s level pack.' % (pack_filename, LEVELPACK_VERSION))
+        if not self.is_complete():
+            self.close()
+            raise ValueError('%s is truncated or corrupt.' % (pack_filename))
+        self.loaded_levels = {} # level number -> level object
+
+    def is_complete(self):
+        """Returns True if the levels in the index follow each other with
+        no gaps and end at the end of the file, so every level can be
+        read."""
+        level_start = LEVELPACK_HEADER.size + LEVELPACK_INDEX_ENTRY.size * self.num_levels
+        if level_start > len(self.data):
+            return False
+        for offset, length, line_num in LEVELPACK_INDEX_ENTRY.iter_unpack(self.data[LEVELPACK_HEADER.size:level_start]):
+            if offset != level_start:
+                return False
+            level_start += length
+        return level_start == len(self.data)
+
+    def __len__(self):
+        return self.num_levels
+
+    def __getitem__(self, level_num):
+        if level_num < 0:
+            level_num += self.num_levels
+        if level_num < 0 or level_num >= self.num_levels:
+            raise IndexError('level number out of range')
+        if level_num not in self.loaded_levels:
+            entry_offset = LEVELPACK_HEADER.size + LEVELPACK_INDEX_ENTRY.size * level_num
+            offset, length, line_num = LEVELPACK_INDEX_ENTRY.unpack_from(self.data, entry_offset)
+            map_text_lines = self.data[offset:offset + length].decode('utf-8').split('\n')
+            self.loaded_levels[level_num] = make_level_obj(map_text_lines, level_num, line_num, self.filename)
+        return self.loaded_levels[level_num]
+
+    def close(self):
+        """Closes the memory map and the pack file. Levels that haven't
+        been loaded yet can't be loaded after this."""
+        self.data.close()
+        self.pack_file.close()
+
+class LevelTexts(object):
+    """A read-only list of the level objects in a level text file, for when
+    there is no level pack. Like a LevelPack, each level is only converted
+    into a level object the first time it is asked for, so a bad level
+    only raises its AssertionError when it is loaded."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.level_texts = read_level_texts(filename)
+        self.loaded_levels = {} # level number -> level object
+
+    def __len__(self):
+        return len(self.level_texts)
+
+    def __getitem__(self, level_num):
+        if level_num < 0:
+            level_num += len(self.level_texts)
+        if level_num < 0 or level_num >= len(self.level_texts):
+            raise IndexError('level number out of range')
+        if level_num not in self.loaded_levels:
+            map_text_lines, line_num = self.level_texts[level_num]
+            self.loaded_levels[level_num] = make_level_obj(map_text_lines, level_num, line_num, self.filename)
+        return self.loaded_levels[level_num]
+
+    def close(self):
+        pass # the text file was closed after reading it
+
+def find_dead_squares(map_obj, goals):
+    """Returns an int used as a bitset with the bit set for every floor
+    cell of the map that a star can never be pushed from onto any goal,
+    no matter where the other stars are. A star on one of these cells
+    means the level can't be solved anymore.
+
+    This works backwards from the goals: a star can get to cell c by being
+    pushed from the next cell over, if there is floor for the player to
+    stand on beyond that."""
+    live = set(goals) # the spaces a star can still get to a goal from
+    to_check = list(goals)
+    while to_check:
+        x, y = to_check.pop()
+        for x_offset, y_offset in ((0, -1), (1, 0), (0, 1), (-1, 0)):
+            star_from = (x - x_offset, y - y_offset)
+            if star_from not in live and is_floor(map_obj, star_from[0], star_from[1]) and is_floor(map_obj, x - 2 * x_offset, y - 2 * y_offset):
+                live.add(star_from)
+                to_check.append(star_from)
+
+    dead_squares = 0
+    for x in range(len(map_obj)):
+        for y in range(len(map_obj[x])):
+            if not is_wall(map_obj, x, y) and (x, y) not in live:
+                dead_squares |= 1 << get_cell(map_obj, x, y)
+    return dead_squares
+
+def is_deadlocked(level_obj, game_state_obj, star_cell=None):
+    """Returns True if the game state can never be solved because too few
+    stars can still reach a goal. A star that is not on a goal can't if it
+    is on a dead square, or is frozen: it can't be pushed in either
+    direction along either axis, because of walls, dead squares or other
+    frozen stars. A level can have more stars than goals, and then that
+    many stars can be stuck without it mattering. Only the star on
+    star_cell (such as the one that was just pushed) is checked for being
+    frozen; if star_cell is None, or the level has more stars than goals,
+    every star is checked."""
+    goals_mask = level_obj['goals_mask']
+    stars = game_state_obj.stars
+    spare_stars = bin(stars).count('1') - len(level_obj['goals'])
+    stuck = stars & level_obj['dead_squares'] & ~goals_mask
+    if bin(stuck).count('1') > spare_stars:
+        return True
 
-    return levels
+    # With spare stars, pushing a star onto a dead square is allowed, so
+    # dead squares don't stop a star from moving. Stars that were frozen
+    # before don't end the game on their own then, so they have to be
+    # counted again, and every star is checked.
+    if spare_stars:
+        dead_squares = 0
+        star_cell = None
+    else:
+        dead_squares = level_obj['dead_squares']
+    if star_cell == None:
+        star_cells = get_star_cells(game_state_obj)
+    else:
+        star_cells = [star_cell]
+    for star_cell in star_cells:
+        frozen_cells = []
+        if is_star_frozen(level_obj, stars, star_cell, set(), frozen_cells, dead_squares):
+            # The frozen stars are stuck together for good, so the ones
+            # that aren't on a goal can never reach one.
+            for cell in frozen_cells:
+                if not goals_mask >> cell & 1:
+                    stuck |= 1 << cell
+            if bin(stuck).count('1') > spare_stars:
+                return True
+    return False
 
-def flood_fill(map_obj, x, y, old_character, new_character): # ????
-    """Changes any values matching oldCharacter on the map object to
-    newCharacter at the (x, y) position, and does the same for the
-    positions to the left, right, down, and up of (x, y), recursively."""
+def is_star_frozen(level_obj, stars, star_cell, checking, frozen_cells, dead_squares):
+    """Returns True if the star on star_cell can't be moved along either
+    axis. Stars in the checking set are being checked further up the
+    call chain and count as walls, which stops the check from going round
+    in circles. A star can't be pushed onto the dead_squares bitset either.
+    Every star found to be frozen is added to frozen_cells."""
+    map_obj = level_obj['map_obj']
+    x, y = get_cell_xy(map_obj, star_cell)
+    checking.add(star_cell)
+    for neighbors in (((x - 1, y), (x + 1, y)), ((x, y - 1), (x, y + 1))):
+        if not is_floor(map_obj, neighbors[0][0], neighbors[0][1]) or not is_floor(map_obj, neighbors[1][0], neighbors[1][1]):
+            continue # a wall on either side blocks this axis
+        cells = [get_cell(map_obj, nx, ny) for nx, ny in neighbors]
+        if dead_squares >> cells[0] & 1 and dead_squares >> cells[1] & 1:
+            continue # pushing either way would put the star on a dead square
+        blocked = False
+        for cell in cells:
+            if cell in checking or (stars >> cell & 1 and is_star_frozen(level_obj, stars, cell, checking, frozen_cells, dead_squares)):
+                blocked = True # a frozen star on either side blocks this axis
+                break
+        if not blocked:
+            return False # the star can still be pushed along this axis
+    frozen_cells.append(star_cell)
+    return True
+
+def flood_fill(map_obj, x, y, old_character, new_character):
+    """Changes any values matching old_character on the map object to
+    new_character at the (x, y) position, and does the same for the
+    positions to the left, right, down, and up of (x, y), and so on until
+    the whole connected area has been changed."""
 
     # In this game, the flood fill algorithm creates the inside/outside
-    # floor distinction. This is a "recursive" function.
-    # For more info on the Flood Fill algorithm, see:
+    # floor distinction. For more info on the Flood Fill algorithm, see:
     #   http://en.wikipedia.org/wiki/Flood_fill
-    if map_obj[x][y] == old_character:
-        map_obj[x][y] = new_character
-
-    if x < len(map_obj) - 1 and map_obj[x+1][y] == old_character:
-        flood_fill(map_obj, x+1, y, old_character, new_character) # call right
-    if x > 0 and map_obj[x-1][y] == old_character:
-        flood_fill(map_obj, x-1, y, old_character, new_character) # call left
-    if y < len(map_obj[x]) and map_obj[x][y+1] == old_character:
-        flood_fill(map_obj, x, y+1, old_character, new_character) # call down
-    if y > 0 and map_obj[x][y-1] == old_character:
-        flood_fill(map_obj, x, y-1, old_character, new_character) # call up
-
-
-def draw_map(map_obj, game_state_obj, goals):
-    """Draws the map to a Surface object, including the player and
-    stars. This function does not call pygame.display.update(), nor
-    does it draw the "Level" and "Steps" text in the corner."""
-
-    # mapSurf will be the single Surface object that the tiles are drawn
-    # on, so that it is easy to position the entire map on the DISPLAYSURF
-    # Surface object. First, the width and height must be calculated.
-    map_surf_width = len(map_obj) * TILEWIDTH
-    map_surf_height = (len(map_obj[0]) - 1) * (TILEHEIGHT - TILEFLOORHEIGHT) + TILEHEIGHT # ????
-    map_surf = pygame.Surface((map_surf_width, map_surf_height))
-    map_surf.fill(BGCOLOR) # start with a blank color on the surface.
-
-    # Draw the tile sprites onto this surface.
+    # This is a "scanline" flood fill: instead of calling itself for each
+    # space (which hits Python's recursion limit on big maps), it fills a
+    # whole run of spaces in a column at once and keeps a list of the
+    # runs in the neighboring columns that still have to be filled.
+    if old_character == new_character:
+        return # nothing would change, and the loop below would never end
+    width = len(map_obj)
+    height = len(map_obj[0])
+
+    to_fill = [(x, y)]
+    if map_obj[x][y] != old_character:
+        # The start space itself doesn't match, but its neighbors still
+        # get filled.
+        to_fill = [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]
+
+    while to_fill:
+        x, y = to_fill.pop()
+        if x < 0 or x >= width or y < 0 or y >= height:
+            continue # off the edge of the map
+        column = map_obj[x]
+        if column[y] != old_character:
+            continue # already filled from another run
+
+        # Find the top and bottom of the run of matching spaces, and fill it.
+        top = y
+        while top > 0 and column[top - 1] == old_character:
+            top -= 1
+        bottom = y
+        while bottom < height - 1 and column[bottom + 1] == old_character:
+            bottom += 1
+        for fill_y in range(top, bottom + 1):
+            column[fill_y] = new_character
+
+        # Remember the start of every matching run next to this one in the
+        # columns to the left and right.
+        for next_x in (x - 1, x + 1):
+            if next_x < 0 or next_x >= width:
+                continue
+            next_column = map_obj[next_x]
+            in_run = False
+            for fill_y in range(top, bottom + 1):
+                if next_column[fill_y] == old_character:
+                    if not in_run:
+                        to_fill.append((next_x, fill_y))
+                    in_run = True
+                else:
+                    in_run = False
+
+def label_regions(map_obj, characters):
+    """Finds every separate area of connected spaces on the map whose
+    character is in characters, and numbers them starting from 0.
+
+    Returns a tuple of a list of lists the same size as map_obj, which has
+    the area number for each (x, y) space (or None if the space's character
+    is not in characters), and the number of areas found."""
+    labels = []
     for x in range(len(map_obj)):
+        labels.append([])
+        for y in range(len(map_obj[x])):
+            if map_obj[x][y] in characters:
+                labels[x].append(-1) # -1 marks a space not labelled yet
+            else:
+                labels[x].append(None)
+
+    num_regions = 0
+    for x in range(len(labels)):
+        for y in range(len(labels[x])):
+            if labels[x][y] == -1:
+                # Found a space of a new area, label the whole area.
+                flood_fill(labels, x, y, -1, num_regions)
+                num_regions += 1
+    return labels, num_regions
+
+def get_space_rect(x, y):
+    """Returns the Rect of the (x, y) space on the map surface. The tiles
+    are taller than the rows are apart, so each space's Rect overlaps the
+    two rows above and below it."""
+    return pygame.Rect((x * TILEWIDTH, y * (TILEHEIGHT - TILEFLOORHEIGHT), TILEWIDTH, TILEHEIGHT)) # ????
+
+def make_terrain_layer(map_obj):
+    """Returns a list of lists with a tuple of the Surface objects to draw
+    for each (x, y) space of the decorated map: the ground/wall tile and
+    any tree/rock decoration. These never change while a level is being
+    played, so they are worked out once per level."""
+    terrain_layer = []
+    for x in range(len(map_obj)):
+        terrain_layer.append([])
         for y in range(len(map_obj[x])):
-            space_rect = pygame.Rect((x * TILEWIDTH, y * (TILEHEIGHT - TILEFLOORHEIGHT), TILEWIDTH, TILEHEIGHT)) # ????
-            if map_obj[x][y] in TILEMAPPING:
-                base_tile = TILEMAPPING[map_obj[x][y]]
-            elif map_obj[x][y] in OUTSIDEDECOMAPPING:
-                base_tile = TILEMAPPING[' ']
-
-            # First draw the base ground/wall tile.
-            map_surf.blit(base_tile, space_rect)
-
             if map_obj[x][y] in OUTSIDEDECOMAPPING:
-                # Draw any tree/rock decorations that are on this tile.
-                map_surf.blit(OUTSIDEDECOMAPPING[map_obj[x][y]], space_rect)
-            elif (x, y) in game_state_obj['stars']:
-                if (x, y) in goals:
-                    # if a goal AND star are on this space, draw goal first.
-                    map_surf.blit(IMAGESDICT['covered goal'], space_rect)
-                # Then draw the star sprite.
-                map_surf.blit(IMAGESDICT['star'], space_rect)
-            elif (x, y) in goals:
-                # Draw a goal without a star on it.
-                map_surf.blit(IMAGESDICT['uncovered goal'], space_rect)
-
-            # Last draw the player on the board.
-            if (x, y) == game_state_obj['player']:
-                # Note: The value "current_image" refers to a key in
-                # "PLAYERIMAGES" which has the specific player image
-                # we want to show.
-                map_surf.blit(PLAYERIMAGES[current_image], space_rect)
-
-    return map_surf
+                terrain_layer[x].append((TILEMAPPING[' '], OUTSIDEDECOMAPPING[map_obj[x][y]]))
+            else:
+                terrain_layer[x].append((TILEMAPPING[map_obj[x][y]],))
+    return terrain_layer
+
+"""
+The map renderer data structure is a dictionary with these keys:
+    'map_obj' - the decorated map object being drawn.
+    'goals' - the level's list of (x, y) goals.
+    'terrain_layer' - the level's terrain layer, see make_terrain_layer().
+    'width' - the width of the whole map in pixels.
+    'height' - the height of the whole map in pixels.
+    'chunks' - a dict mapping the (chunkx, chunky) of each chunk that has
+               been drawn to its Surface object. Chunk (chunkx, chunky)
+               holds the map pixels starting at (chunkx * CHUNK_WIDTH,
+               chunky * CHUNK_HEIGHT).
+"""
+
+def make_map_renderer(map_obj, goals):
+    """Returns a new map renderer (see above) for the decorated map. No
+    chunks are drawn until they are needed."""
+    return {'map_obj': map_obj,
+            'goals': goals,
+            'terrain_layer': make_terrain_layer(map_obj),
+            'width': len(map_obj) * TILEWIDTH,
+            'height': (len(map_obj[0]) - 1) * (TILEHEIGHT - TILEFLOORHEIGHT) + TILEHEIGHT, # ????
+            'chunks': {}}
+
+def get_chunk_rect(map_renderer, chunk_xy):
+    """Returns the Rect of the map pixels held by the chunk."""
+    chunk_rect = pygame.Rect(chunk_xy[0] * CHUNK_WIDTH, chunk_xy[1] * CHUNK_HEIGHT, CHUNK_WIDTH, CHUNK_HEIGHT)
+    return chunk_rect.clip(pygame.Rect(0, 0, map_renderer['width'], map_renderer['height']))
+
+def get_chunks_in_area(map_renderer, area):
+    """Returns a list of the (chunkx, chunky) of every chunk that overlaps
+    the area, a Rect in map pixels."""
+    area = area.clip(pygame.Rect(0, 0, map_renderer['width'], map_renderer['height']))
+    if area.width == 0 or area.height == 0:
+        return []
+    chunks = []
+    for chunkx in range(area.left // CHUNK_WIDTH, (area.right - 1) // CHUNK_WIDTH + 1):
+        for chunky in range(area.top // CHUNK_HEIGHT, (area.bottom - 1) // CHUNK_HEIGHT + 1):
+            chunks.append((chunkx, chunky))
+    return chunks
+
+def get_map_chunk(map_renderer, game_state_obj, chunk_xy):
+    """Returns the Surface object of the chunk, drawing it first if it
+    isn't in the renderer's chunks yet."""
+    if chunk_xy not in map_renderer['chunks']:
+        chunk_rect = get_chunk_rect(map_renderer, chunk_xy)
+        chunk_surf = pygame.Surface(chunk_rect.size)
+        draw_map_area(chunk_surf, chunk_rect.topleft, map_renderer, game_state_obj, chunk_rect)
+        map_renderer['chunks'][chunk_xy] = chunk_surf
+    return map_renderer['chunks'][chunk_xy]
+
+def draw_map_chunks(surf, map_renderer, game_state_obj, map_rect):
+    """Draws the map chunks that overlap the surface's clipping area onto
+    the surface, with the map's top left corner at map_rect.topleft. Chunks
+    that aren't drawn yet are drawn first."""
+    visible_area = surf.get_clip().move(-map_rect.left, -map_rect.top)
+    for chunk_xy in get_chunks_in_area(map_renderer, visible_area):
+        chunk_rect = get_chunk_rect(map_renderer, chunk_xy)
+        surf.blit(get_map_chunk(map_renderer, game_state_obj, chunk_xy), chunk_rect.move(map_rect.topleft))
+
+def evict_map_chunks(map_renderer, visible_area):
+    """Throws away the chunks that are more than CHUNK_KEEP_DISTANCE pixels
+    away from the visible area, a Rect in map pixels."""
+    keep_area = visible_area.inflate(CHUNK_KEEP_DISTANCE * 2, CHUNK_KEEP_DISTANCE * 2)
+    for chunk_xy in list(map_renderer['chunks'].keys()):
+        if not keep_area.colliderect(get_chunk_rect(map_renderer, chunk_xy)):
+            del map_renderer['chunks'][chunk_xy]
+
+def draw_map_area(surf, surf_topleft, map_renderer, game_state_obj, area):
+    """Draws the part of the map inside the area (a Rect in map pixels)
+    onto the surface, whose top left corner is at the surf_topleft map
+    pixel. Nothing outside the area is changed."""
+    map_obj = map_renderer['map_obj']
+    row_height = TILEHEIGHT - TILEFLOORHEIGHT
+    old_clip = surf.get_clip()
+    surf.set_clip(area.move(-surf_topleft[0], -surf_topleft[1]))
+    surf.fill(BGCOLOR) # start with a blank color on the surface.
+
+    # The tiles are taller than the rows are apart, so a space overlaps
+    # the area if its tile does, even when its row starts above the area.
+    # Each column is drawn top to bottom so the lower tiles are drawn over
+    # the higher ones.
+    first_x = max(0, area.left // TILEWIDTH)
+    last_x = min(len(map_obj) - 1, (area.right - 1) // TILEWIDTH)
+    first_y = max(0, (area.top - TILEHEIGHT) // row_height + 1)
+    last_y = min(len(map_obj[0]) - 1, (area.bottom - 1) // row_height)
+    for x in range(first_x, last_x + 1):
+        for y in range(first_y, last_y + 1):
+            draw_space(surf, surf_topleft, map_renderer, game_state_obj, x, y)
+    surf.set_clip(old_clip)
+
+def draw_space(surf, surf_topleft, map_renderer, game_state_obj, x, y):
+    """Draws the terrain, goal, star and player sprites of a single (x, y)
+    space onto the surface, whose top left corner is at the surf_topleft
+    map pixel."""
+    map_obj = map_renderer['map_obj']
+    goals = map_renderer['goals']
+    space_rect = get_space_rect(x, y).move(-surf_topleft[0], -surf_topleft[1])
+
+    # First draw the base ground/wall tile and any tree/rock decoration.
+    for tile in map_renderer['terrain_layer'][x][y]:
+        surf.blit(tile, space_rect)
+
+    if map_obj[x][y] in OUTSIDEDECOMAPPING:
+        pass # stars and goals are never on decorated spaces
+    elif game_state_obj.stars >> get_cell(map_obj, x, y) & 1:
+        if (x, y) in goals:
+            # if a goal AND star are on this space, draw goal first.
+            surf.blit(IMAGESDICT['covered goal'], space_rect)
+        # Then draw the star sprite.
+        surf.blit(IMAGESDICT['star'], space_rect)
+    elif (x, y) in goals:
+        # Draw a goal without a star on it.
+        surf.blit(IMAGESDICT['uncovered goal'], space_rect)
+
+    # Last draw the player on the board.
+    if get_cell(map_obj, x, y) == game_state_obj.player:
+        # Note: The value "current_image" refers to a key in
+        # "PLAYERIMAGES" which has the specific player image
+        # we want to show.
+        surf.blit(PLAYERIMAGES[current_image], space_rect)
+
+def get_changed_cells(map_obj, old_game_state_obj, new_game_state_obj):
+    """Returns a list of the (x, y) spaces whose player or star changed
+    between the two game states."""
+    changed_cells = [get_cell_xy(map_obj, old_game_state_obj.player),
+                     get_cell_xy(map_obj, new_game_state_obj.player)]
+    # The bits that differ between the two star bitsets are the spaces a
+    # star was pushed from and to.
+    changed_stars = old_game_state_obj.stars ^ new_game_state_obj.stars
+    while changed_stars:
+        lowest_bit = changed_stars & -changed_stars
+        changed_cells.append(get_cell_xy(map_obj, lowest_bit.bit_length() - 1))
+        changed_stars ^= lowest_bit
+    return changed_cells
+
+def update_map_cells(map_renderer, game_state_obj, cells):
+    """Redraws only the given (x, y) spaces in the chunks that have been
+    drawn, instead of drawing the whole chunks again. Chunks that haven't
+    been drawn will be drawn with the new game state when they are needed.
+
+    Returns a list of the Rects (in map pixels) that were redrawn."""
+    dirty_rects = []
+    for x, y in set(cells):
+        space_rect = get_space_rect(x, y)
+        dirty_rects.append(space_rect)
+        for chunk_xy in get_chunks_in_area(map_renderer, space_rect):
+            if chunk_xy in map_renderer['chunks']:
+                chunk_rect = get_chunk_rect(map_renderer, chunk_xy)
+                draw_map_area(map_renderer['chunks'][chunk_xy], chunk_rect.topleft, map_renderer, game_state_obj, space_rect.clip(chunk_rect))
+    return dirty_rects
 
 def is_level_finished(level_obj, game_state_obj):
     """Returns True if all the goals have stars in them."""
-    for goal in level_obj['goals']:
-        if goal not in game_state_obj['stars']:
-            # Found a space with a goal but no star on it.
-            return False
-    return True
+    # Any goal bit that isn't also a star bit is a goal without a star.
+    return level_obj['goals_mask'] & ~game_state_obj.stars == 0
 
 def terminate():
     pygame.quit()
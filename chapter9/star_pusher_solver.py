@@ -0,0 +1,389 @@
+# Star Pusher Solver
+# Finds solutions for the levels used by star_pusher.py.
+# Creative Commons BY-NC-SA 3.0 US
+
+import sys, time, heapq
+from collections import deque
+
+import star_pusher
+from star_pusher import UP, DOWN, LEFT, RIGHT
+
+# The solver searches over "push states": the positions of the stars plus
+# the area the player can walk to without pushing anything. Walking is
+# free, so only pushes are counted as search steps. The moves are
+# written out afterwards in LURD notation (lowercase letters are plain
+# moves, uppercase letters are pushes).
+LURD_CHARS = {LEFT: 'l', UP: 'u', RIGHT: 'r', DOWN: 'd'}
+LURD_DIRECTIONS = {'l': LEFT, 'u': UP, 'r': RIGHT, 'd': DOWN}
+DIRECTIONS = (UP, RIGHT, DOWN, LEFT)
+FLOOR_CHARACTERS = (' ', '.', '$', '@', '+', '*') # every level file character that isn't a wall
+
+MAX_NODES = 200000 # default number of push states to expand before giving up
+INFINITY = float('inf')
+
+"""
+The solver works on the game's cell numbers (x * map_height + y, see
+star_pusher.get_cell()) instead of (x, y) tuples, which keeps the map
+lookups to a single list index.
+
+The solver data structure ("solver_map") is a dictionary with these keys:
+    'width' - the number of columns in the map.
+    'height' - the number of rows in the map.
+    'floor' - a list with a bool for every cell, True if it is floor inside the level's walls.
+    'steps' - a dict mapping each direction to the cell number offset of one step in that direction.
+    'goals' - a frozenset of the goal cell numbers.
+    'goal_distances' - a list with the fewest pushes needed to move a star from that cell onto any goal (INFINITY if it can never get there).
+"""
+
+def make_solver_map(level_obj):
+    """Builds the solver_map for the given level object. See the comment
+    above for the keys it has."""
+    map_obj = level_obj['map_obj']
+    width = len(map_obj)
+    height = len(map_obj[0])
+
+    # Only the area the player starts in is floor; the spaces outside
+    # the level's walls can never be walked on or pushed onto.
+    labels, num_regions = star_pusher.label_regions(map_obj, FLOOR_CHARACTERS)
+    playerx, playery = star_pusher.get_cell_xy(map_obj, level_obj['start_state'].player)
+    player_label = labels[playerx][playery]
+    floor = [False] * (width * height)
+    for x in range(width):
+        for y in range(height):
+            floor[x * height + y] = labels[x][y] == player_label
+
+    # The edge cells are never treated as floor so that a step can never
+    # wrap around to the other side of the map.
+    for x in range(width):
+        floor[x * height] = False
+        floor[x * height + height - 1] = False
+    for y in range(height):
+        floor[y] = False
+        floor[(width - 1) * height + y] = False
+
+    solver_map = {'width': width,
+                  'height': height,
+                  'floor': floor,
+                  'steps': {UP: -1, DOWN: 1, LEFT: -height, RIGHT: height},
+                  'goals': frozenset(x * height + y for x, y in level_obj['goals'])}
+    solver_map['goal_distances'] = get_goal_distances(solver_map)
+    return solver_map
+
+def pad_level(level_obj):
+    """Returns a copy of the level object with a ring of empty space added
+    around the map, so that no star or player ever stands on the edge of
+    the map. The solution for the padded level is the same as for the
+    original level."""
+    map_obj = level_obj['map_obj']
+    map_text_lines = [' ' * (len(map_obj) + 2)]
+    for y in range(len(map_obj[0])):
+        map_text_lines.append(' ' + ''.join([map_obj[x][y] for x in range(len(map_obj))]) + ' ')
+    map_text_lines.append(' ' * (len(map_obj) + 2))
+    return star_pusher.make_level_obj(map_text_lines, 0, 0, 'the padded level')
+
+def get_goal_distances(solver_map):
+    """Returns a list with the fewest number of pushes needed to get a star
+    from each cell onto the nearest goal, ignoring all other stars. This is
+    done with a breadth first search backwards from the goals: a star that
+    is at cell c can have been pushed there from c - step if the player
+    stood at c - 2 * step."""
+    floor = solver_map['floor']
+    distances = [INFINITY] * len(floor)
+    queue = deque()
+    for goal in solver_map['goals']:
+        distances[goal] = 0
+        queue.append(goal)
+
+    while queue:
+        cell = queue.popleft()
+        for step in solver_map['steps'].values():
+            star_from = cell - step
+            player_from = cell - 2 * step
+            if floor[star_from] and floor[player_from] and distances[star_from] == INFINITY:
+                distances[star_from] = distances[cell] + 1
+                queue.append(star_from)
+    return distances
+
+def get_reachable(solver_map, player, stars):
+    """Returns a set of every cell the player can walk to from the player
+    cell without pushing any of the stars (a bitset of star cells)."""
+    floor = solver_map['floor']
+    steps = tuple(solver_map['steps'].values())
+    reachable = {player}
+    stack = [player]
+    while stack:
+        cell = stack.pop()
+        for step in steps:
+            next_cell = cell + step
+            if floor[next_cell] and next_cell not in reachable and not stars >> next_cell & 1:
+                reachable.add(next_cell)
+                stack.append(next_cell)
+    return reachable
+
+def get_pushed_player(solver_map, reachable, min_reachable, star, star_to, new_stars):
+    """Returns the smallest cell the player can reach after pushing the
+    star at the star cell to star_to, from the set of cells (and its
+    smallest cell) that the player could reach before the push. All of
+    the cells that were walled off by stars before can only be reached
+    through the star's old cell, so they are searched for on their own.
+    Unless the star was pushed into the cell that used to be the smallest
+    one, that cell is usually still reachable, which is quicker to find
+    than flood filling the whole area again."""
+    floor = solver_map['floor']
+    steps = tuple(solver_map['steps'].values())
+    new_cells = {star}
+    stack = [star]
+    while stack:
+        cell = stack.pop()
+        for step in steps:
+            next_cell = cell + step
+            if (floor[next_cell] and next_cell not in new_cells and next_cell not in reachable and
+                not new_stars >> next_cell & 1):
+                new_cells.add(next_cell)
+                stack.append(next_cell)
+    player = min(min_reachable, min(new_cells))
+    if star_to not in reachable:
+        return player # none of the old area was blocked off
+    if star_to != min_reachable and is_reachable(solver_map, star, min_reachable, new_stars):
+        return player
+    return min(get_reachable(solver_map, star, new_stars))
+
+def is_reachable(solver_map, start, end, stars):
+    """Returns True if the player can walk from the start cell to the end
+    cell without pushing any stars. The search tries the steps toward
+    smaller cell numbers first, since the end cell is always the smallest
+    cell of an area here."""
+    floor = solver_map['floor']
+    steps = sorted(solver_map['steps'].values(), reverse=True) # the last one pushed is tried first
+    seen = {start}
+    stack = [start]
+    while stack:
+        cell = stack.pop()
+        if cell == end:
+            return True
+        for step in steps:
+            next_cell = cell + step
+            if floor[next_cell] and next_cell not in seen and not stars >> next_cell & 1:
+                seen.add(next_cell)
+                stack.append(next_cell)
+    return False
+
+def normalize_player(game_state_obj, player):
+    """Returns a copy of the game state with the player moved to the given
+    cell, keeping the Zobrist hash up to date."""
+    zobrist = game_state_obj.zobrist ^ star_pusher.ZOBRIST_PLAYER_KEYS[game_state_obj.player] ^ star_pusher.ZOBRIST_PLAYER_KEYS[player]
+    return star_pusher.GameState(player, game_state_obj.stars, zobrist)
+
+def get_heuristic(solver_map, stars):
+    """Returns a lower bound on the number of pushes left to solve the
+    level. Every goal needs its own star, so it is at least the sum of the
+    distances to their nearest goals of the len(goals) stars that are
+    closest to one. (If there are more stars than goals, the others can
+    stay where they are.) It is INFINITY if too few stars can reach a
+    goal."""
+    goal_distances = solver_map['goal_distances']
+    distances = [goal_distances[star] for star in stars]
+    num_goals = len(solver_map['goals'])
+    if len(distances) > num_goals:
+        distances = heapq.nsmallest(num_goals, distances)
+    return sum(distances)
+
+def find_walk(solver_map, start, end, stars):
+    """Returns a string of LURD moves that walks the player from the start
+    cell to the end cell without pushing any stars, or None if there is no
+    such path. The stars are given as a bitset of star cells."""
+    floor = solver_map['floor']
+    steps = solver_map['steps']
+    came_from = {start: None}
+    queue = deque([start])
+    while queue:
+        cell = queue.popleft()
+        if cell == end:
+            break
+        for direction in DIRECTIONS:
+            next_cell = cell + steps[direction]
+            if floor[next_cell] and next_cell not in came_from and not stars >> next_cell & 1:
+                came_from[next_cell] = (cell, direction)
+                queue.append(next_cell)
+    if end not in came_from:
+        return None
+
+    moves = []
+    cell = end
+    while came_from[cell] != None:
+        cell, direction = came_from[cell]
+        moves.append(LURD_CHARS[direction])
+    moves.reverse()
+    return ''.join(moves)
+
+def solve_level(level_obj, max_nodes=MAX_NODES, time_limit=None):
+    """Searches for a solution to the level with A* over push states.
+
+    Returns a result dictionary with these keys:
+        'solution' - the LURD move string, or None if none was found.
+        'pushes' - the number of pushes in the solution (or None).
+        'nodes' - the number of push states that were expanded.
+        'generated' - the number of push states that were generated.
+        'time' - the wall clock time the search took, in seconds.
+        'status' - 'solved', 'unsolvable' or 'limit' (max_nodes or
+                   time_limit was reached first)."""
+    start_time = time.time()
+    padded_level = pad_level(level_obj)
+    solver_map = make_solver_map(padded_level)
+    floor = solver_map['floor']
+    steps = solver_map['steps']
+    goals_mask = padded_level['goals_mask']
+    goal_distances = solver_map['goal_distances']
+    player_keys = star_pusher.ZOBRIST_PLAYER_KEYS
+    star_keys = star_pusher.ZOBRIST_STAR_KEYS
+
+    # The search states are the game's own GameState tuples, but with the
+    # player moved to the smallest cell it can reach. That way states
+    # that differ only by where the player is standing inside the same
+    # area are not searched twice.
+    start_state = padded_level['start_state']
+    # the stars that don't have to go on a goal
+    spare_stars = bin(start_state.stars).count('1') - len(solver_map['goals'])
+    start_reachable = get_reachable(solver_map, start_state.player, start_state.stars)
+    start_key = normalize_player(start_state, min(start_reachable))
+
+    # came_from maps a state to (parent state, star cell, push direction).
+    came_from = {start_key: None}
+    best_pushes = {start_key: 0}
+    start_estimate = get_heuristic(solver_map, star_pusher.get_star_cells(start_state))
+    open_heap = [(start_estimate, 0, start_key)]
+    if start_estimate == INFINITY:
+        open_heap = [] # too few stars can reach a goal to ever solve it
+    nodes = 0
+    generated = 1
+    status = 'unsolvable'
+    final_key = None
+
+    while open_heap:
+        estimate, pushes, key = heapq.heappop(open_heap)
+        if pushes > best_pushes[key]:
+            continue # a shorter way to this state was already expanded
+        stars = key.stars
+        if goals_mask & ~stars == 0:
+            status = 'solved'
+            final_key = key
+            break
+
+        if nodes >= max_nodes or (time_limit != None and time.time() - start_time > time_limit):
+            status = 'limit'
+            break
+        nodes += 1
+
+        star_cells = star_pusher.get_star_cells(key)
+        reachable = get_reachable(solver_map, key.player, stars)
+        min_reachable = key.player # the states are normalized to it
+        for star in star_cells:
+            for direction in DIRECTIONS:
+                step = steps[direction]
+                star_to = star + step
+                if star - step not in reachable or not floor[star_to] or stars >> star_to & 1:
+                    continue
+                if goal_distances[star_to] == INFINITY and not spare_stars:
+                    continue # the star could never reach a goal from there
+                new_stars = stars ^ (1 << star) ^ (1 << star_to)
+                # is_deadlocked() only looks at the stars, so it is checked
+                # before working out where the player can get to
+                if star_pusher.is_deadlocked(padded_level, star_pusher.GameState(star, new_stars, 0), star_to):
+                    continue # the pushed star is frozen off a goal
+                new_player = get_pushed_player(solver_map, reachable, min_reachable, star, star_to, new_stars)
+                # Update the Zobrist hash for the moved star and player.
+                zobrist = key.zobrist ^ star_keys[star] ^ star_keys[star_to] ^ player_keys[key.player] ^ player_keys[new_player]
+                new_key = star_pusher.GameState(new_player, new_stars, zobrist)
+                if new_key in best_pushes and best_pushes[new_key] <= pushes + 1:
+                    continue
+                if spare_stars:
+                    # The stars nearest the goals may have changed. Stars
+                    # can be on cells with no way to a goal, so the
+                    # estimate can't be updated from the pushed star alone
+                    # (INFINITY - INFINITY is nan).
+                    new_estimate = pushes + 1 + get_heuristic(solver_map, star_pusher.get_star_cells(new_key))
+                    if new_estimate == INFINITY:
+                        continue # too few stars can still reach a goal
+                else:
+                    # Every star is on a cell with a way to a goal (pushes
+                    # anywhere else were pruned above), so none of these
+                    # distances is INFINITY.
+                    new_estimate = estimate - goal_distances[star] + goal_distances[star_to] + 1
+                best_pushes[new_key] = pushes + 1
+                came_from[new_key] = (key, star, direction)
+                generated += 1
+                heapq.heappush(open_heap, (new_estimate, pushes + 1, new_key))
+
+    solution = None
+    solution_pushes = None
+    if status == 'solved':
+        pushes_list = []
+        key = final_key
+        while came_from[key] != None:
+            parent_key, star, direction = came_from[key]
+            pushes_list.append((star, direction))
+            key = parent_key
+        pushes_list.reverse()
+        solution = get_lurd_moves(solver_map, start_state.player, start_state.stars, pushes_list)
+        solution_pushes = len(pushes_list)
+
+    return {'solution': solution,
+            'pushes': solution_pushes,
+            'nodes': nodes,
+            'generated': generated,
+            'time': time.time() - start_time,
+            'status': status}
+
+def get_lurd_moves(solver_map, player, stars, pushes_list):
+    """Turns a list of (star cell, direction) pushes into a full LURD move
+    string, adding the walking moves needed to get behind each star."""
+    steps = solver_map['steps']
+    moves = []
+    for star, direction in pushes_list:
+        moves.append(find_walk(solver_map, player, star - steps[direction], stars))
+        moves.append(LURD_CHARS[direction].upper())
+        stars ^= (1 << star) | (1 << (star + steps[direction]))
+        player = star
+    return ''.join(moves)
+
+def replay_solution(level_obj, moves):
+    """Plays the LURD move string on the level with the game's own
+    make_move() function. Returns True if every move was possible and the
+    level is finished at the end, otherwise False."""
+    map_obj = level_obj['map_obj']
+    game_state_obj = level_obj['start_state']
+    for move in moves:
+        game_state_obj = star_pusher.make_move(map_obj, game_state_obj, LURD_DIRECTIONS[move.lower()])
+        if game_state_obj == None:
+            return False
+    return star_pusher.is_level_finished(level_obj, game_state_obj)
+
+def main():
+    # Solves every level in a level file and prints the search statistics.
+    # Usage: python star_pusher_solver.py [level file] [max nodes]
+    filename = 'starPusherLevels.txt'
+    max_nodes = MAX_NODES
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    if len(sys.argv) > 2:
+        max_nodes = int(sys.argv[2])
+
+    levels = star_pusher.read_levels_file(filename)
+    total_nodes = 0
+    total_time = 0.0
+    num_solved = 0
+    for level_num in range(len(levels)):
+        result = solve_level(levels[level_num], max_nodes)
+        total_nodes += result['nodes']
+        total_time += result['time']
+        if result['status'] == 'solved':
+            assert replay_solution(levels[level_num], result['solution']), 'Solution for level %s does not replay.' % (level_num + 1)
+            num_solved += 1
+        print('Level %s: %s, %s pushes, %s nodes, %.3f seconds' % (level_num + 1, result['status'], result['pushes'], result['nodes'], result['time']))
+
+    print('Solved %s of %s levels.' % (num_solved, len(levels)))
+    if total_time > 0:
+        print('%s nodes in %.2f seconds (%d nodes per second).' % (total_nodes, total_time, total_nodes / total_time))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# Star Pusher Level Validator
+# Checks every level in a Star Pusher level file without opening a window.
+# Creative Commons BY-NC-SA 3.0 US
+
+import os, sys, time, argparse
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1') # keep the report clean
+import star_pusher
+import star_pusher_solver
+
+"""
+Usage: python validate_levels.py [level file] [--workers N] [--solve] [--max-nodes N]
+
+Each level is checked in a separate worker process for:
+    * The basic sanity checks done by star_pusher.make_level_obj() (a start
+      point, at least one goal and enough stars).
+    * Reachability: every star and goal must be in the same area of floor as
+      the player's start (unless the star starts on the goal).
+    * Deadlocks: enough stars to fill the goals must start off able to
+      reach them, not frozen or on a dead square off a goal (see
+      star_pusher.is_deadlocked()).
+    * With --solve, the level is also run through the solver.
+
+The report data structure returned for each level is a dictionary with these keys:
+    'level_num' - the index of the level in the file.
+    'problems' - a list of strings describing what is wrong with the level. It is empty if the level passed.
+    'solver' - the result dictionary from star_pusher_solver.solve_level(), or None if --solve wasn't used.
+    'time' - how long checking the level took, in seconds.
+"""
+
+# The compiled level pack opened once in each worker process.
+WORKER_LEVELS = None
+
+def init_worker(filename):
+    global WORKER_LEVELS
+    WORKER_LEVELS = star_pusher.open_levels_file(filename)
+
+def check_level(level_num, solve, max_nodes):
+    """Runs the checks on one level of WORKER_LEVELS and returns the
+    level's report (see the comment above)."""
+    start_time = time.time()
+    report = {'level_num': level_num, 'problems': [], 'solver': None}
+    try:
+        level_obj = WORKER_LEVELS[level_num]
+    except AssertionError as error:
+        report['problems'].append(str(error))
+        report['time'] = time.time() - start_time
+        return report
+
+    report['problems'].extend(check_reachability(level_obj))
+    if star_pusher.is_deadlocked(level_obj, level_obj['start_state']):
+        report['problems'].append('Too many stars start frozen or on squares where they can never reach a goal.')
+
+    if solve and not report['problems']:
+        report['solver'] = star_pusher_solver.solve_level(level_obj, max_nodes)
+        if report['solver']['status'] == 'unsolvable':
+            report['problems'].append('The solver proved the level has no solution.')
+
+    report['time'] = time.time() - start_time
+    return report
+
+def check_reachability(level_obj):
+    """Returns a list of problems for any star or goal that is not in the
+    same area of floor as the player's start. A star that starts on a goal
+    in a walled off area is fine, some levels use those as decoration."""
+    map_obj = level_obj['map_obj']
+    labels, num_regions = star_pusher.label_regions(map_obj, star_pusher_solver.FLOOR_CHARACTERS)
+    playerx, playery = star_pusher.get_cell_xy(map_obj, level_obj['start_state'].player)
+    player_label = labels[playerx][playery]
+
+    problems = []
+    for x in range(len(map_obj)):
+        for y in range(len(map_obj[x])):
+            if labels[x][y] == player_label:
+                continue
+            if map_obj[x][y] == '$':
+                problems.append('The star at (%s, %s) is walled off from the player.' % (x, y))
+            elif map_obj[x][y] == '.':
+                problems.append('The goal at (%s, %s) is walled off from the player.' % (x, y))
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description='Check every level in a Star Pusher level file.')
+    parser.add_argument('filename', nargs='?', default='starPusherLevels.txt', help='the level file to check')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--solve', action='store_true', help='also try to solve each level')
+    parser.add_argument('--max-nodes', type=int, default=star_pusher_solver.MAX_NODES, help='solver node limit per level')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    # Compile (or refresh) the level pack once here, so that the workers
+    # only have to open it.
+    levels = star_pusher.open_levels_file(args.filename)
+    num_levels = len(levels)
+    levels.close()
+
+    num_failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args.filename,)) as executor:
+        reports = executor.map(check_level, range(num_levels), [args.solve] * num_levels,
+                               [args.max_nodes] * num_levels, chunksize=max(1, num_levels // (args.workers * 8)))
+        for report in reports:
+            status = 'ok'
+            if report['problems']:
+                status = 'FAILED'
+                num_failed += 1
+            line = 'Level %s: %s (%.1f ms)' % (report['level_num'] + 1, status, report['time'] * 1000)
+            if report['solver'] != None:
+                line += ' - solver: %s, %s pushes, %s nodes' % (report['solver']['status'], report['solver']['pushes'], report['solver']['nodes'])
+            print(line)
+            for problem in report['problems']:
+                print('    ' + problem)
+
+    print('%s of %s levels passed in %.2f seconds using %s workers.' % (num_levels - num_failed, num_levels, time.time() - start_time, args.workers))
+    if num_failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()